@@ -0,0 +1,169 @@
+import math
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache
+
+GENERATION_KEY = 'generation:{}'
+
+
+def _fresh_generation():
+    # Счётчик, вытесненный из кэша, начинается заново с текущего времени
+    # в наносекундах, а не с единицы: так он не совпадёт с прежними
+    # значениями, пока изменений меньше одного в наносекунду.
+    return time.time_ns()
+
+
+def get_generations(scopes):
+    """Поколения нескольких областей по отдельности одним чтением кэша:
+    ``{scope: значение}``."""
+    keys = {GENERATION_KEY.format(scope): scope for scope in scopes}
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, _fresh_generation(), None)
+            values[key] = cache.get(key)
+    return {scope: values[key] for key, scope in keys.items()}
+
+
+def get_generation(*scopes):
+    """Возвращает строку-поколение для набора областей.
+
+    Строка меняется при каждом ``bump_generation`` любой из областей,
+    поэтому её можно добавлять в ключ кэша вместо короткого TTL.
+    """
+    values = get_generations(scopes)
+    return '.'.join(str(values[scope]) for scope in scopes)
+
+
+def bump_generation(*scopes):
+    """Делает устаревшими все ключи, построенные с этими областями."""
+    for scope in scopes:
+        key = GENERATION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _fresh_generation(), None)
+
+
+STATS_KEY = 'cache_stats:{}'
+STATS = ('hit', 'miss', 'stale', 'refresh', 'early_refresh', 'coalesced')
+LOCK_KEY = 'lock:{}'
+LOCK_TIMEOUT = 30
+WAIT_TIMEOUT = 2
+POLL_INTERVAL = 0.05
+STALE_TTL = 60
+STATS_FLUSH_INTERVAL = 10
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def _count(event):
+    # Счётчик в памяти процесса: запись в общий кэш на каждое попадание
+    # стоила бы дороже самого попадания.
+    global _flushed_at
+    with _stats_lock:
+        _stats[event] += 1
+        due = time.monotonic() - _flushed_at >= STATS_FLUSH_INTERVAL
+        if due:
+            _flushed_at = time.monotonic()
+    if due:
+        flush_stats()
+
+
+def flush_stats():
+    """Переносит накопленные процессом счётчики в общий кэш."""
+    with _stats_lock:
+        pending = dict(_stats)
+        _stats.clear()
+    for event, count in pending.items():
+        key = STATS_KEY.format(event)
+        if cache.add(key, count, None):
+            continue
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            cache.set(key, count, None)
+
+
+def get_stats():
+    """Счётчики обращений к get_or_refresh во всех процессах. Другие
+    процессы переносят свои счётчики раз в ``STATS_FLUSH_INTERVAL``."""
+    flush_stats()
+    keys = {STATS_KEY.format(event): event for event in STATS}
+    values = cache.get_many(keys)
+    return {event: values.get(key, 0) for key, event in keys.items()}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+    cache.delete_many([STATS_KEY.format(event) for event in STATS])
+
+
+def _should_refresh_early(expires, delta, beta):
+    # Вероятностное раннее обновление (XFetch): чем ближе срок и чем
+    # дольше пересчёт, тем вероятнее обновить значение заранее.
+    return time.time() - delta * beta * math.log(random.random()) >= expires
+
+
+def _refresh(key, compute, timeout, stale_ttl):
+    started = time.time()
+    value = compute()
+    delta = time.time() - started
+    cache.set(key, (value, started + timeout, delta), timeout + stale_ttl)
+    return value
+
+
+def get_or_refresh(key, compute, timeout, stale_ttl=STALE_TTL, beta=1.0):
+    """Значение из кэша с защитой от «набега» на пересчёт.
+
+    Пересчитывает ``compute()`` только один процесс, взявший блокировку:
+    остальные при промахе ждут его результата, а при истёкшем значении
+    отдают устаревшее ещё ``stale_ttl`` секунд (stale-while-revalidate).
+    Незадолго до истечения значение с небольшой вероятностью
+    обновляется заранее, чтобы срок не наступал у всех одновременно.
+    """
+    lock_key = LOCK_KEY.format(key)
+    entry = cache.get(key)
+    if entry is not None:
+        value, expires, delta = entry
+        expired = time.time() >= expires
+        if not expired and not _should_refresh_early(expires, delta, beta):
+            _count('hit')
+            return value
+        if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+            # Значение уже пересчитывает другой процесс.
+            _count('stale' if expired else 'hit')
+            _count('coalesced')
+            return value
+        if not expired:
+            _count('early_refresh')
+    else:
+        _count('miss')
+        deadline = time.time() + WAIT_TIMEOUT
+        while not cache.add(lock_key, 1, LOCK_TIMEOUT):
+            if time.time() >= deadline:
+                # Держатель блокировки завис: считаем сами, не дожидаясь.
+                _count('refresh')
+                return compute()
+            time.sleep(POLL_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None:
+                _count('coalesced')
+                return entry[0]
+        entry = cache.get(key)
+        if entry is not None:
+            # Пока брали блокировку, значение успели положить.
+            cache.delete(lock_key)
+            _count('coalesced')
+            return entry[0]
+    try:
+        _count('refresh')
+        return _refresh(key, compute, timeout, stale_ttl)
+    finally:
+        cache.delete(lock_key)
@@ -0,0 +1,384 @@
+"""Двухуровневый кэш: LRU в памяти процесса поверх общего файла SQLite.
+
+Второй уровень — файл SQLite, который видят все воркеры на хосте.
+Первый — небольшой LRU в памяти каждого процесса. Каждая запись
+во второй уровень добавляется в журнал инвалидаций; воркеры читают
+журнал не реже раза в ``SYNC_INTERVAL`` секунд и выбрасывают из своего
+LRU изменённые ключи.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backend.TwoTierCache',
+            'LOCATION': os.path.join(STATE_DIR, 'cache.sqlite3'),
+            'OPTIONS': {'L1_MAX_ENTRIES': 1000, 'SYNC_INTERVAL': 0.05},
+        }
+    }
+
+Значения хранятся в pickle, поэтому файл доступен только владельцу:
+каталог создаётся с правами 0700, файл — 0600, а чужой файл или
+каталог, открытый на запись другим, бэкенд не откроет.
+"""
+import os
+import pickle
+import random
+import sqlite3
+import stat
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+CLEAR_ALL = '*'
+TIERS = ('l1_hits', 'l1_misses', 'l2_hits', 'l2_misses')
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache_entries ('
+    ' key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)',
+    'CREATE INDEX IF NOT EXISTS cache_entries_expires'
+    ' ON cache_entries (expires)',
+    'CREATE TABLE IF NOT EXISTS cache_invalidations ('
+    ' id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL,'
+    ' origin TEXT NOT NULL, created REAL NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS cache_stats ('
+    ' pid INTEGER PRIMARY KEY, l1_hits INTEGER, l1_misses INTEGER,'
+    ' l2_hits INTEGER, l2_misses INTEGER, updated REAL)',
+)
+
+
+def _check_owner(path, info):
+    if info.st_uid != os.geteuid():
+        raise ImproperlyConfigured(
+            f'{path} принадлежит другому пользователю')
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise ImproperlyConfigured(f'{path} открыт на запись другим')
+
+
+def prepare_private_file(path):
+    """Создаёт каталог и файл базы, доступные только владельцу
+    процесса, и проверяет уже существующие."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    _check_owner(directory, os.stat(directory))
+    descriptor = os.open(path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW,
+                         0o600)
+    try:
+        info = os.fstat(descriptor)
+        _check_owner(path, info)
+        if stat.S_IMODE(info.st_mode) != 0o600:
+            os.fchmod(descriptor, 0o600)
+    finally:
+        os.close(descriptor)
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self.l1_timeout = float(options.get('L1_TIMEOUT', 60))
+        self.sync_interval = float(options.get('SYNC_INTERVAL', 0.05))
+        self.stats_interval = float(options.get('STATS_INTERVAL', 1))
+        self.journal_ttl = float(options.get('JOURNAL_TTL', 60))
+        self._l1 = OrderedDict()
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._stats = dict.fromkeys(TIERS, 0)
+        self._pid = self._origin = self._last_seen = None
+        self._synced = self._stats_flushed = 0.0
+
+    # Второй уровень.
+
+    def _connection(self):
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            # После fork соединение родителя использовать нельзя.
+            prepare_private_file(self.path)
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None,
+                check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection, self._local.pid = connection, pid
+            if self._last_seen is None or self._pid != pid:
+                self._reset_process_state(connection, pid)
+        return self._local.connection
+
+    def _reset_process_state(self, connection, pid):
+        with self._lock:
+            self._pid = pid
+            # Метка этого LRU в журнале: свои записи он уже применил сам.
+            self._origin = uuid.uuid4().hex
+            self._l1.clear()
+            self._stats = dict.fromkeys(TIERS, 0)
+            row = connection.execute(
+                'SELECT MAX(id) FROM cache_invalidations').fetchone()
+            self._last_seen = row[0] or 0
+
+    def _write(self, statements):
+        """Выполняет изменения одной транзакцией и журналирует ключи."""
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            result = statements(connection, now)
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        return result
+
+    def _journal(self, connection, keys, now):
+        connection.executemany(
+            'INSERT INTO cache_invalidations (key, origin, created) '
+            'VALUES (?, ?, ?)',
+            [(key, self._origin, now) for key in keys])
+
+    # Первый уровень.
+
+    def _sync(self):
+        """Применяет к LRU процесса инвалидации других воркеров."""
+        connection = self._connection()
+        now = time.time()
+        if now - self._synced >= self.sync_interval:
+            rows = connection.execute(
+                'SELECT id, key, origin FROM cache_invalidations '
+                'WHERE id > ?',
+                (self._last_seen,)).fetchall()
+            with self._lock:
+                for row_id, key, origin in rows:
+                    if origin == self._origin:
+                        pass
+                    elif key == CLEAR_ALL:
+                        self._l1.clear()
+                    else:
+                        self._l1.pop(key, None)
+                    self._last_seen = max(self._last_seen, row_id)
+                self._synced = now
+        if now - self._stats_flushed >= self.stats_interval:
+            self._flush_stats(connection, now)
+
+    def _flush_stats(self, connection, now):
+        with self._lock:
+            values = [self._stats[tier] for tier in TIERS]
+            self._stats_flushed = now
+        connection.execute(
+            'INSERT OR REPLACE INTO cache_stats VALUES (?, ?, ?, ?, ?, ?)',
+            [os.getpid(), *values, now])
+        if random.random() < 0.01:
+            connection.execute(
+                'DELETE FROM cache_invalidations WHERE created < ?',
+                (now - self.journal_ttl,))
+
+    def _l1_get(self, key):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None or entry[1] <= time.time():
+                self._l1.pop(key, None)
+                self._stats['l1_misses'] += 1
+                return None
+            self._l1.move_to_end(key)
+            self._stats['l1_hits'] += 1
+            return entry[0]
+
+    def _l1_set(self, key, data, expires):
+        l1_expires = time.time() + self.l1_timeout
+        if expires is not None:
+            l1_expires = min(l1_expires, expires)
+        with self._lock:
+            self._l1[key] = (data, l1_expires)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_drop(self, keys):
+        with self._lock:
+            for key in keys:
+                self._l1.pop(key, None)
+
+    # API кэша Django.
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._sync()
+        data = self._l1_get(key)
+        if data is None:
+            row = self._connection().execute(
+                'SELECT value, expires FROM cache_entries WHERE key = ?',
+                (key,)).fetchone()
+            if row is None or row[1] is not None and row[1] <= time.time():
+                with self._lock:
+                    self._stats['l2_misses'] += 1
+                return default
+            with self._lock:
+                self._stats['l2_hits'] += 1
+            data = row[0]
+            self._l1_set(key, data, row[1])
+        return pickle.loads(data)
+
+    def _store(self, connection, key, value, timeout, now, only_new=False):
+        expires = self.get_backend_timeout(timeout)
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if only_new:
+            connection.execute(
+                'DELETE FROM cache_entries WHERE key = ? AND expires <= ?',
+                (key, now))
+            stored = connection.execute(
+                'INSERT OR IGNORE INTO cache_entries VALUES (?, ?, ?)',
+                (key, data, expires)).rowcount
+        else:
+            stored = connection.execute(
+                'INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?)',
+                (key, data, expires)).rowcount
+        if stored:
+            self._journal(connection, [key], now)
+            if self._cull_frequency and random.random() < 0.01:
+                self._cull(connection, now)
+        return bool(stored), data, expires
+
+    def _cull(self, connection, now):
+        connection.execute(
+            'DELETE FROM cache_entries WHERE expires <= ?', (now,))
+        count = connection.execute(
+            'SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        if count > self._max_entries:
+            connection.execute(
+                'DELETE FROM cache_entries WHERE key IN ('
+                ' SELECT key FROM cache_entries ORDER BY expires LIMIT ?)',
+                (count // self._cull_frequency,))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        stored, data, expires = self._write(
+            lambda connection, now: self._store(
+                connection, key, value, timeout, now, only_new=True))
+        self._l1_drop([key])
+        if stored:
+            self._l1_set(key, data, expires)
+        return stored
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        _, data, expires = self._write(
+            lambda connection, now: self._store(
+                connection, key, value, timeout, now))
+        self._l1_set(key, data, expires)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        keys = {self.make_key(key, version=version): value
+                for key, value in data.items()}
+        for key in keys:
+            self.validate_key(key)
+
+        def store_all(connection, now):
+            return [(key, *self._store(connection, key, value, timeout,
+                                       now)[1:])
+                    for key, value in keys.items()]
+
+        for key, stored_data, expires in self._write(store_all):
+            self._l1_set(key, stored_data, expires)
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        def touch_entry(connection, now):
+            updated = connection.execute(
+                'UPDATE cache_entries SET expires = ? '
+                'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), key, now)).rowcount
+            if updated:
+                self._journal(connection, [key], now)
+            return bool(updated)
+
+        # L1 чистится после коммита: иначе параллельное чтение успеет
+        # вернуть в него старое значение из ещё не изменённой базы.
+        touched = self._write(touch_entry)
+        self._l1_drop([key])
+        return touched
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        def increment(connection, now):
+            row = connection.execute(
+                'SELECT value, expires FROM cache_entries WHERE key = ?',
+                (key,)).fetchone()
+            if row is None or row[1] is not None and row[1] <= now:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache_entries SET value = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key))
+            self._journal(connection, [key], now)
+            return value
+
+        try:
+            return self._write(increment)
+        finally:
+            self._l1_drop([key])
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+
+        def delete_entries(connection, now):
+            connection.executemany(
+                'DELETE FROM cache_entries WHERE key = ?',
+                [(key,) for key in keys])
+            self._journal(connection, keys, now)
+
+        self._write(delete_entries)
+        self._l1_drop(keys)
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def clear(self):
+        def delete_all(connection, now):
+            connection.execute('DELETE FROM cache_entries')
+            self._journal(connection, [CLEAR_ALL], now)
+
+        self._write(delete_all)
+        with self._lock:
+            self._l1.clear()
+
+    def close(self, **kwargs):
+        # Соединение живёт весь срок жизни потока: открывать SQLite
+        # на каждый запрос дороже, чем держать его.
+        pass
+
+    # Статистика.
+
+    def process_stats(self):
+        """Попадания и промахи уровней в текущем процессе."""
+        with self._lock:
+            return dict(self._stats, l1_entries=len(self._l1))
+
+    def tier_stats(self):
+        """Попадания и промахи уровней по всем процессам на хосте."""
+        connection = self._connection()
+        self._flush_stats(connection, time.time())
+        rows = connection.execute(
+            'SELECT pid, l1_hits, l1_misses, l2_hits, l2_misses, updated '
+            'FROM cache_stats ORDER BY pid').fetchall()
+        return [dict(zip(('pid', *TIERS, 'updated'), row)) for row in rows]
+
+    def reset_tier_stats(self):
+        with self._lock:
+            self._stats = dict.fromkeys(TIERS, 0)
+        self._connection().execute('DELETE FROM cache_stats')
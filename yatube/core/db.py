@@ -0,0 +1,30 @@
+"""Настройка соединений с SQLite.
+
+Каждое новое соединение получает ``settings.SQLITE_PRAGMAS``: журнал
+WAL, при котором писатель не блокирует читателей, ``synchronous=NORMAL``
+(в режиме WAL сбой питания может потерять последние транзакции, но
+не целостность базы), отображение файла в память, больший кэш страниц
+и ожидание занятой базы вместо ошибки ``database is locked``. Вместе
+с ``CONN_MAX_AGE`` соединение с этими настройками переживает запрос,
+а не открывается заново на каждый.
+"""
+from django.conf import settings
+
+
+def pragma_statements(pragmas):
+    return [f'PRAGMA {name} = {value}' for name, value in pragmas.items()]
+
+
+def apply_pragmas(connection, pragmas):
+    """Выполняет ``pragmas`` на соединении модуля ``sqlite3``."""
+    for statement in pragma_statements(pragmas):
+        connection.execute(statement)
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Обработчик ``connection_created``."""
+    if connection.vendor != 'sqlite':
+        return
+    # Напрямую, мимо курсора Django: настройка не должна попадать
+    # в журнал и счётчики запросов.
+    apply_pragmas(connection.connection, settings.SQLITE_PRAGMAS)
@@ -0,0 +1,278 @@
+"""Очередь фоновых задач в базе проекта.
+
+Побочные действия записи — миниатюры, раскладка постов по лентам
+подписчиков, письма — записываются в базу и не теряются при перезапуске
+процесса. Если изменение идёт в ``transaction.atomic()`` (как сохранение
+поста в представлениях и в админке), задача ставится в той же транзакции
+и появляется, только если изменение зафиксировано. В режиме автофиксации
+задача пишется отдельно сразу после изменения, и сбой между ними её
+потеряет. Выполняет задачи команда run_workers; без неё миниатюры,
+ленты и письма не появятся, пока не включён ``settings.JOBS_EAGER``.
+
+Тип задачи — функция с декоратором ``job``; её аргументы передаются
+именованными и хранятся в JSON:
+
+    @job(concurrency=2)
+    def generate_thumbnails(post_id):
+        ...
+
+    generate_thumbnails.enqueue(post_id=post.pk, key=f'thumbnails:{post.pk}')
+
+Задача с ``key`` не ставится, пока такая же ждёт в очереди. Упавшая
+задача повторяется с удваивающейся задержкой, пока не кончатся
+``max_attempts`` попыток, и остаётся в базе со статусом failed.
+Воркер захватывает задачу условным UPDATE, поэтому несколько воркеров
+не возьмут одну задачу, а задачу упавшего воркера возьмут после
+окончания аренды ``lease``. Обработчик должен выдерживать повторный
+запуск.
+"""
+import json
+import logging
+import threading
+import traceback
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Сколько задач просматривать за один захват.
+CLAIM_BATCH = 100
+
+JobType = namedtuple('JobType',
+                     'name func concurrency max_attempts retry_delay lease')
+
+_types = {}
+
+
+def job(concurrency=1, max_attempts=5, retry_delay=30, lease=10 * 60):
+    """Регистрирует функцию как тип задачи и добавляет ей ``enqueue``.
+
+    ``concurrency`` — сколько задач типа процесс воркера выполняет
+    одновременно (``settings.JOB_CONCURRENCY`` переопределяет),
+    ``retry_delay`` — задержка перед первым повтором в секундах,
+    ``lease`` — сколько секунд задача считается выполняемой.
+    """
+    def decorator(func):
+        name = f'{func.__module__}.{func.__name__}'
+        _types[name] = JobType(name, func, concurrency, max_attempts,
+                               retry_delay, lease)
+        func.enqueue = partial(enqueue, name)
+        return func
+    return decorator
+
+
+def get_type(name):
+    """Тип задачи; модуль с ним импортируется, если воркер его ещё
+    не загрузил."""
+    if name not in _types:
+        import_string(name)
+    return _types[name]
+
+
+def concurrency(name):
+    return settings.JOB_CONCURRENCY.get(name, get_type(name).concurrency)
+
+
+def enqueue(name, key=None, delay=0, **kwargs):
+    """Ставит задачу ``name`` в очередь. Возвращает её или None, если
+    задача с тем же ``key`` уже ждёт.
+
+    При ``settings.JOBS_EAGER`` задача выполняется в этом процессе
+    после фиксации транзакции.
+    """
+    payload = json.dumps(kwargs, cls=DjangoJSONEncoder)
+    if settings.JOBS_EAGER:
+        transaction.on_commit(partial(_run_eager, name, payload))
+        return None
+    instance = Job(name=name, key=key, payload=payload,
+                   run_at=timezone.now() + timedelta(seconds=delay))
+    if key is None:
+        instance.save()
+        return instance
+    if Job.objects.filter(key=key).exists():
+        return None
+    try:
+        with transaction.atomic():
+            instance.save()
+    except IntegrityError:
+        # Такую же задачу успел поставить другой запрос.
+        return None
+    return instance
+
+
+def _run_eager(name, payload):
+    try:
+        get_type(name).func(**json.loads(payload))
+    except Exception:
+        logger.exception('Задача %s не выполнена', name)
+
+
+def _limit(name):
+    try:
+        return concurrency(name)
+    except (ImportError, KeyError):
+        # Неизвестный тип: задачу всё равно надо взять, чтобы отметить.
+        return 1
+
+
+def claim(free, running=()):
+    """Захватывает до ``free`` готовых задач так, чтобы вместе
+    с ``running`` (Counter выполняемых задач по типам) задач каждого
+    типа было не больше ``concurrency(name)``."""
+    running = Counter(running)
+    now = timezone.now()
+    due = (Q(status=Job.QUEUED, run_at__lte=now)
+           | Q(status=Job.RUNNING, locked_until__lt=now))
+    full = [name for name, count in running.items() if count >= _limit(name)]
+    candidates = (Job.objects.filter(due).exclude(name__in=full)
+                  .order_by('run_at', 'id')
+                  .values_list('id', 'name')[:CLAIM_BATCH])
+    claimed = []
+    for pk, name in candidates:
+        if len(claimed) >= free:
+            break
+        if running[name] >= _limit(name):
+            continue
+        try:
+            lease = get_type(name).lease
+        except (ImportError, KeyError):
+            lease = 0
+        taken = Job.objects.filter(due, pk=pk).update(
+            status=Job.RUNNING, key=None, attempts=F('attempts') + 1,
+            locked_until=now + timedelta(seconds=lease))
+        if taken:
+            claimed.append(pk)
+            running[name] += 1
+    return list(Job.objects.filter(pk__in=claimed).order_by('run_at', 'id'))
+
+
+def execute(instance):
+    """Выполняет захваченную задачу: удаляет её при успехе, иначе
+    откладывает повтор или отмечает как невыполненную."""
+    try:
+        job_type = get_type(instance.name)
+    except (ImportError, KeyError):
+        _fail(instance, traceback.format_exc(), final=True)
+        return False
+    if instance.attempts > job_type.max_attempts:
+        # Воркер падал на этой задаче, не успев записать ошибку.
+        _fail(instance, 'Истекла аренда последней попытки', final=True)
+        return False
+    try:
+        job_type.func(**json.loads(instance.payload))
+    except Exception:
+        logger.exception('Задача %s #%s не выполнена', instance.name,
+                         instance.pk)
+        final = instance.attempts >= job_type.max_attempts
+        delay = job_type.retry_delay * 2 ** (instance.attempts - 1)
+        _fail(instance, traceback.format_exc(), final, delay)
+        return False
+    Job.objects.filter(pk=instance.pk).delete()
+    return True
+
+
+def _fail(instance, error, final, delay=0):
+    if final:
+        changes = {'status': Job.FAILED}
+    else:
+        changes = {'status': Job.QUEUED,
+                   'run_at': timezone.now() + timedelta(seconds=delay)}
+    Job.objects.filter(pk=instance.pk).update(
+        locked_until=None, last_error=error, **changes)
+
+
+class Worker:
+    """Выполняет задачи в пуле из ``threads`` потоков, не больше
+    ``concurrency(name)`` задач одного типа сразу. При ``threads = 0``
+    задачи выполняются по одной в вызывающем потоке."""
+
+    def __init__(self, threads, poll_interval=1.0):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.running = Counter()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.done = 0
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+
+    def run(self, burst=False):
+        """Выполняет задачи до ``stop()``, а при ``burst`` — пока есть
+        готовые. Возвращает число выполненных задач."""
+        if not self.threads:
+            return self._run_inline(burst)
+        pool = ThreadPoolExecutor(max_workers=self.threads,
+                                  thread_name_prefix='jobs')
+        try:
+            while not self.stopping.is_set():
+                # Событие сбрасывается до снимка: задача, завершившаяся
+                # после него, разбудит цикл.
+                self.wakeup.clear()
+                with self.lock:
+                    running = +self.running
+                if self._fill(pool, running):
+                    continue
+                # Без выполняемых задач пустой захват значит, что готовых
+                # нет, а не что их типы заняты.
+                if burst and not running:
+                    break
+                self.wakeup.wait(self.poll_interval)
+        finally:
+            pool.shutdown(wait=True)
+        return self.done
+
+    def _run_inline(self, burst):
+        while not self.stopping.is_set():
+            claimed = claim(1)
+            if not claimed:
+                if burst:
+                    break
+                self.stopping.wait(self.poll_interval)
+                continue
+            self.done += execute(claimed[0])
+        return self.done
+
+    def _fill(self, pool, running):
+        free = self.threads - sum(running.values())
+        if free <= 0:
+            return 0
+        claimed = claim(free, running)
+        for instance in claimed:
+            with self.lock:
+                self.running[instance.name] += 1
+            pool.submit(self._execute, instance)
+        return len(claimed)
+
+    def _execute(self, instance):
+        try:
+            succeeded = execute(instance)
+        except Exception:
+            # Ошибка записи в базу: задачу вернёт истёкшая аренда.
+            logger.exception('Не удалось завершить задачу %s', instance.pk)
+            succeeded = False
+        finally:
+            connections.close_all()
+        with self.lock:
+            self.running[instance.name] -= 1
+            self.done += succeeded
+        self.wakeup.set()
+
+
+def run_pending():
+    """Выполняет все готовые задачи в этом потоке, например в тестах.
+    Возвращает число выполненных."""
+    return Worker(threads=0).run(burst=True)
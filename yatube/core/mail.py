@@ -0,0 +1,48 @@
+"""Отправка писем через очередь ``core.jobs``.
+
+``QueuedEmailBackend`` в ``settings.EMAIL_BACKEND`` только ставит письмо
+в очередь, а отправляет его задача ``send_email`` бэкендом
+``settings.QUEUED_EMAIL_BACKEND``: запрос, например сброс пароля,
+не ждёт почтовый сервер, а неудачная отправка повторяется. Письма
+с вложениями отправляются сразу: вложения в очереди не хранятся.
+"""
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+
+from .jobs import job
+
+FIELDS = ('subject', 'body', 'from_email', 'to', 'cc', 'bcc', 'reply_to')
+
+
+def serialize(message):
+    data = {field: getattr(message, field) for field in FIELDS}
+    data['headers'] = message.extra_headers
+    data['alternatives'] = getattr(message, 'alternatives', [])
+    return data
+
+
+def deserialize(data):
+    data = dict(data)
+    data['alternatives'] = [tuple(item) for item in data['alternatives']]
+    return EmailMultiAlternatives(**data)
+
+
+@job(concurrency=2, max_attempts=8, retry_delay=60)
+def send_email(message):
+    get_connection(settings.QUEUED_EMAIL_BACKEND).send_messages(
+        [deserialize(message)])
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        attached = [message for message in email_messages
+                    if message.attachments]
+        if attached:
+            get_connection(settings.QUEUED_EMAIL_BACKEND,
+                           fail_silently=self.fail_silently).send_messages(
+                attached)
+        for message in email_messages:
+            if not message.attachments:
+                send_email.enqueue(message=serialize(message))
+        return len(email_messages)
@@ -0,0 +1,59 @@
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+USERNAME = 'bench_sessions_user'
+
+ENGINES = (
+    ('db + ModelBackend', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'AUTHENTICATION_BACKENDS': [
+            'django.contrib.auth.backends.ModelBackend'],
+    }),
+    ('кэш + CachedModelBackend', {
+        'SESSION_ENGINE': 'core.session_backend',
+        'AUTHENTICATION_BACKENDS': [
+            'users.backends.CachedModelBackend'],
+    }),
+)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает число запросов и время ответа на странице для гостя '
+            'и авторизованного пользователя с сессиями в базе и в кэше.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='/',
+                            help='Какую страницу запрашивать.')
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Сколько запросов в каждом замере.')
+
+    def handle(self, *args, **options):
+        user, _ = get_user_model().objects.get_or_create(username=USERNAME)
+        for title, engine in ENGINES:
+            with override_settings(**engine):
+                logged_in = Client()
+                logged_in.force_login(user)
+                for client, who in ((Client(), 'гость'),
+                                    (logged_in, 'пользователь')):
+                    queries, elapsed = self.measure(
+                        client, options['url'], options['requests'])
+                    self.stdout.write(
+                        f'{title:<26} {who:<13} '
+                        f'запросов к БД на ответ: {queries:5.2f}  '
+                        f'{elapsed * 1000:7.2f} мс')
+
+    @staticmethod
+    def measure(client, url, requests):
+        # Первый запрос прогревает кэши страницы и пользователя.
+        client.get(url)
+        with CaptureQueriesContext(connection) as captured:
+            started = perf_counter()
+            for _ in range(requests):
+                client.get(url)
+            elapsed = perf_counter() - started
+        return len(captured) / requests, elapsed / requests
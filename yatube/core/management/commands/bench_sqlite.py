@@ -0,0 +1,134 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.db import apply_pragmas
+
+# Как у модуля sqlite3 и Django без настроек: журнал DELETE, полная
+# синхронизация, ожидание занятой базы 5 с.
+DEFAULT_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+}
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, author_id INTEGER, '
+    'text TEXT, pub_date REAL)',
+    'CREATE INDEX post_pub_date ON post (pub_date)',
+)
+PAGE_QUERY = ('SELECT id, author_id, text, pub_date FROM post '
+              'WHERE pub_date < ? ORDER BY pub_date DESC LIMIT 10')
+INSERT = 'INSERT INTO post (author_id, text, pub_date) VALUES (?, ?, ?)'
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность SQLite на чтение и запись '
+            'при одновременных читателях и писателях: настройки '
+            'по умолчанию с соединением на операцию, SQLITE_PRAGMAS '
+            'с соединением на операцию и с постоянными соединениями.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8,
+                            help='Сколько потоков читают страницы постов.')
+        parser.add_argument('--writers', type=int, default=2,
+                            help='Сколько потоков добавляют посты.')
+        parser.add_argument('--seconds', type=float, default=5.0,
+                            help='Сколько длится каждый замер.')
+        parser.add_argument('--rows', type=int, default=20000,
+                            help='Сколько постов в таблице до замера.')
+
+    def handle(self, *args, **options):
+        if options['readers'] < 0 or options['writers'] < 0:
+            raise CommandError('Число потоков не может быть отрицательным.')
+        cases = (
+            ('по умолчанию, соединение на операцию', DEFAULT_PRAGMAS, False),
+            ('SQLITE_PRAGMAS, соединение на операцию',
+             settings.SQLITE_PRAGMAS, False),
+            ('SQLITE_PRAGMAS, постоянные соединения',
+             settings.SQLITE_PRAGMAS, True),
+        )
+        for title, pragmas, persistent in cases:
+            directory = tempfile.mkdtemp()
+            try:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self.seed(path, pragmas, options['rows'])
+                reads, writes, errors = self.measure(
+                    path, pragmas, persistent, options)
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+            seconds = options['seconds']
+            self.stdout.write(
+                f'{title:<40} чтений/с: {reads / seconds:8.0f}  '
+                f'записей/с: {writes / seconds:7.0f}  ошибок: {errors}')
+
+    @staticmethod
+    def connect(path, pragmas):
+        # Автофиксация, как в Django: каждая запись — своя транзакция.
+        database = sqlite3.connect(path, isolation_level=None,
+                                   check_same_thread=False)
+        apply_pragmas(database, pragmas)
+        return database
+
+    def seed(self, path, pragmas, rows):
+        database = self.connect(path, pragmas)
+        try:
+            for statement in SCHEMA:
+                database.execute(statement)
+            database.execute('BEGIN')
+            database.executemany(INSERT, ((i % 100, f'Пост {i}', float(i))
+                                          for i in range(rows)))
+            database.execute('COMMIT')
+        finally:
+            database.close()
+
+    def measure(self, path, pragmas, persistent, options):
+        deadline = perf_counter() + options['seconds']
+        counts = {'read': 0, 'write': 0, 'error': 0}
+        lock = threading.Lock()
+
+        def operation(kind, database, number):
+            if kind == 'read':
+                database.execute(PAGE_QUERY,
+                                 (float(number * 7919 % options['rows']),)
+                                 ).fetchall()
+            else:
+                database.execute(INSERT, (number % 100, 'Новый пост',
+                                          float(options['rows'] + number)))
+
+        def run(kind):
+            database = self.connect(path, pragmas) if persistent else None
+            done = errors = number = 0
+            try:
+                while perf_counter() < deadline:
+                    number += 1
+                    current = database or self.connect(path, pragmas)
+                    try:
+                        operation(kind, current, number)
+                        done += 1
+                    except sqlite3.OperationalError:
+                        errors += 1
+                    finally:
+                        if current is not database:
+                            current.close()
+            finally:
+                if database is not None:
+                    database.close()
+            with lock:
+                counts[kind] += done
+                counts['error'] += errors
+
+        threads = ([threading.Thread(target=run, args=('read',))
+                    for _ in range(options['readers'])]
+                   + [threading.Thread(target=run, args=('write',))
+                      for _ in range(options['writers'])])
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return counts['read'], counts['write'], counts['error']
@@ -0,0 +1,46 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from core.cache import get_stats, reset_stats
+from core.cache_backend import TIERS
+
+
+class Command(BaseCommand):
+    help = ('Печатает попадания и промахи уровней кэша по процессам '
+            'и счётчики get_or_refresh.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить статистику после вывода.')
+
+    def handle(self, *args, **options):
+        if hasattr(cache, 'tier_stats'):
+            rows = cache.tier_stats()
+            totals = dict.fromkeys(TIERS, 0)
+            for row in rows:
+                self.stdout.write(self.format_row(f'pid {row["pid"]}', row))
+                for tier in TIERS:
+                    totals[tier] += row[tier] or 0
+            self.stdout.write(self.format_row('всего', totals))
+        else:
+            self.stdout.write(self.style.WARNING(
+                'Бэкенд кэша не ведёт статистику уровней.'))
+        stats = get_stats()
+        self.stdout.write('get_or_refresh: ' + ', '.join(
+            f'{event} {count}' for event, count in stats.items()))
+        if options['reset']:
+            if hasattr(cache, 'reset_tier_stats'):
+                cache.reset_tier_stats()
+            reset_stats()
+
+    @staticmethod
+    def format_row(title, row):
+        l1 = row['l1_hits'] or 0, row['l1_misses'] or 0
+        l2 = row['l2_hits'] or 0, row['l2_misses'] or 0
+        return (f'{title}: L1 {l1[0]}/{sum(l1)} ({ratio(*l1)}), '
+                f'L2 {l2[0]}/{sum(l2)} ({ratio(*l2)})')
+
+
+def ratio(hits, misses):
+    total = hits + misses
+    return f'{hits / total:.0%}' if total else '—'
@@ -0,0 +1,50 @@
+import os
+import sqlite3
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def wal_size(connection):
+    path = f'{connection.settings_dict["NAME"]}-wal'
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+class Command(BaseCommand):
+    help = ('Обновляет статистику планировщика SQLite (PRAGMA optimize или '
+            'полный ANALYZE) и переносит журнал WAL в базу. Запускайте '
+            'по расписанию, например раз в час.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Какую базу обслуживать.')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Полный ANALYZE всех таблиц, например после '
+                                 'массовой загрузки.')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда обслуживает только SQLite.')
+        connection.ensure_connection()
+        database = connection.connection
+        started = perf_counter()
+        if options['analyze']:
+            database.execute('ANALYZE')
+        else:
+            database.execute('PRAGMA optimize')
+        self.stdout.write(
+            f'Статистика обновлена за {perf_counter() - started:.2f} с')
+        before = wal_size(connection)
+        try:
+            busy, _, _ = database.execute(
+                'PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        except sqlite3.OperationalError:
+            # Внутри открытой транзакции переносить журнал нельзя.
+            busy = True
+        style = self.style.WARNING if busy else self.style.SUCCESS
+        self.stdout.write(style(
+            f'Журнал WAL: {before / 1024:.0f} КиБ -> '
+            f'{wal_size(connection) / 1024:.0f} КиБ'
+            + (' (база занята, перенесён не весь)' if busy else '')))
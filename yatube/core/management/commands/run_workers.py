@@ -0,0 +1,73 @@
+import multiprocessing
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.jobs import Worker
+from core.models import Job
+
+
+def work(threads, poll_interval, burst):
+    worker = Worker(threads, poll_interval)
+    previous = signal.signal(signal.SIGTERM, lambda *args: worker.stop())
+    try:
+        return worker.run(burst=burst)
+    except KeyboardInterrupt:
+        worker.stop()
+        return worker.done
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Выполняет фоновые задачи из очереди core.jobs: миниатюры, '
+            'раскладку постов по лентам, письма. Пределы задач одного типа '
+            'действуют в каждом процессе отдельно.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Сколько процессов запустить.')
+        parser.add_argument('--threads', type=int,
+                            default=settings.JOB_WORKER_THREADS,
+                            help='Сколько потоков в каждом процессе; 0 — '
+                                 'выполнять задачи по одной.')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Через сколько секунд проверять очередь, '
+                                 'когда она пуста.')
+        parser.add_argument('--burst', action='store_true',
+                            help='Выйти, когда готовых задач не останется.')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1 or options['threads'] < 0:
+            raise CommandError('Нужен хотя бы один процесс.')
+        work_args = (options['threads'], options['poll'], options['burst'])
+        if options['processes'] == 1:
+            done = work(*work_args)
+            self.report(done)
+            return
+        # Соединения родителя не должны достаться потомкам.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        children = [context.Process(target=work, args=work_args)
+                    for _ in range(options['processes'])]
+        for child in children:
+            child.start()
+        try:
+            for child in children:
+                child.join()
+        except KeyboardInterrupt:
+            for child in children:
+                child.terminate()
+                child.join()
+        self.report()
+
+    def report(self, done=None):
+        if done is not None:
+            self.stdout.write(f'Выполнено задач: {done}')
+        failed = Job.objects.filter(status=Job.FAILED).count()
+        if failed:
+            self.stdout.write(self.style.WARNING(
+                f'Не выполнено и ждёт разбора: {failed}'))
@@ -10,3 +10,41 @@ class CreatedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class Job(CreatedModel):
+    """Фоновая задача из ``core.jobs``.
+
+    ``key`` не даёт поставить вторую такую же задачу, пока первая ждёт
+    в очереди; воркер снимает его, когда берёт задачу. ``locked_until`` —
+    срок аренды выполняемой задачи: после него задачу упавшего воркера
+    возьмёт другой.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Не выполнена'),
+    )
+
+    name = models.CharField('Тип', max_length=200)
+    payload = models.TextField('Аргументы', default='{}')
+    key = models.CharField('Ключ', max_length=200, unique=True,
+                           blank=True, null=True)
+    status = models.CharField('Состояние', max_length=10, choices=STATUSES,
+                              default=QUEUED)
+    run_at = models.DateTimeField('Выполнить после')
+    locked_until = models.DateTimeField('Аренда до', blank=True, null=True)
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+
+    def __str__(self) -> str:
+        return f'{self.name} #{self.pk}: {self.status}'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'],
+                         name='job_status_run_at_idx'),
+        ]
@@ -0,0 +1,44 @@
+"""Сессии в кэше с продлением срока, когда он подходит к концу.
+
+Как ``django.contrib.sessions.backends.cached_db``, но срок сессии
+продлевается не на каждом запросе, а на первом после
+``settings.SESSION_RENEW_AFTER`` секунд с прошлого сохранения: тогда
+сессия записывается в кэш и базу и получает новую cookie. Остальные
+запросы авторизованного пользователя сессию не пишут. Пустые сессии
+анонимов не сохраняются вовсе.
+"""
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import \
+    SessionStore as CachedDBStore
+
+KEY_PREFIX = 'core.session_backend'
+RENEWED_KEY_PREFIX = 'core.session_backend.renewed'
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = KEY_PREFIX
+
+    @property
+    def renewed_key(self):
+        return RENEWED_KEY_PREFIX + self.session_key
+
+    def load(self):
+        data = super().load()
+        # Метка живёт до следующего продления: кто смог её добавить,
+        # тот и продлевает; SessionMiddleware сохранит изменённую сессию.
+        # add — это запись, поэтому сначала дешёвое чтение метки.
+        if (data and self._cache.get(self.renewed_key) is None
+                and self._cache.add(self.renewed_key, 1,
+                                    settings.SESSION_RENEW_AFTER)):
+            self.modified = True
+        return data
+
+    def save(self, must_create=False):
+        super().save(must_create)
+        self._cache.set(self.renewed_key, 1, settings.SESSION_RENEW_AFTER)
+
+    def delete(self, session_key=None):
+        super().delete(session_key)
+        session_key = session_key or self.session_key
+        if session_key is not None:
+            self._cache.delete(RENEWED_KEY_PREFIX + session_key)
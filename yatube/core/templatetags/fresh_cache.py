@@ -0,0 +1,49 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+from django.utils.safestring import mark_safe
+
+from core.cache import get_or_refresh
+
+register = template.Library()
+
+
+class FreshCacheNode(template.Node):
+    def __init__(self, nodelist, expire_time, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.expire_time = expire_time
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        try:
+            expire_time = int(self.expire_time.resolve(context))
+        except (template.VariableDoesNotExist, TypeError, ValueError):
+            raise template.TemplateSyntaxError(
+                f'"fresh_cache" tag got a non-integer timeout value: '
+                f'{self.expire_time.var!r}')
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        return mark_safe(get_or_refresh(
+            key, lambda: self.nodelist.render(context), expire_time))
+
+
+@register.tag('fresh_cache')
+def do_fresh_cache(parser, token):
+    """Как ``{% cache %}``, но с защитой от одновременного пересчёта:
+
+        {% fresh_cache 600 fragment_name var1 var2 %}
+            ...
+        {% endfresh_cache %}
+    """
+    nodelist = parser.parse(('endfresh_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{tokens[0]}' tag requires at least 2 arguments.")
+    return FreshCacheNode(
+        nodelist,
+        parser.compile_filter(tokens[1]),
+        tokens[2],
+        [parser.compile_filter(token) for token in tokens[3:]],
+    )
@@ -1,5 +1,46 @@
-from django.test import TestCase
+import os
+import shutil
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import (LOCK_KEY, bump_generation, get_generation, get_or_refresh,
+                    get_stats)
+from .cache_backend import TwoTierCache
+from .db import apply_pragmas
+from .jobs import claim, job, run_pending
+from .models import Job
+from .session_backend import RENEWED_KEY_PREFIX
+
+CALLS = []
+
+
+@job(max_attempts=2, retry_delay=60)
+def record(value):
+    CALLS.append(value)
+
+
+@job(max_attempts=2)
+def explode():
+    raise ValueError('Сбой')
 
 
 class TemplatesErrorTest(TestCase):
@@ -11,3 +52,359 @@ class TemplatesErrorTest(TestCase):
         response = self.guest_client.get('/nonexist-page/')
         self.assertEqual(response.status_code, 404)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class GenerationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bump_changes_only_its_scopes(self):
+        """bump_generation меняет поколение только своих областей"""
+        first = get_generation('a', 'b')
+        other = get_generation('c')
+        bump_generation('b')
+        self.assertNotEqual(get_generation('a', 'b'), first)
+        self.assertEqual(get_generation('c'), other)
+
+    def test_evicted_generation_is_not_reused(self):
+        """Вытесненное из кэша поколение не повторяет прежнее значение"""
+        bump_generation('a')
+        first = get_generation('a')
+        cache.clear()
+        self.assertNotEqual(get_generation('a'), first)
+
+
+class GetOrRefreshTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        time.sleep(0.1)
+        return f'значение {self.calls}'
+
+    def test_concurrent_misses_compute_once(self):
+        """Одновременные промахи пересчитывают значение один раз"""
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                get_or_refresh('key', self.compute, 60)))
+            for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(set(results), {'значение 1'})
+        stats = get_stats()
+        self.assertEqual(stats['refresh'], 1)
+        self.assertEqual(stats['coalesced'], 4)
+
+    def test_expired_value_is_served_while_refreshing(self):
+        """Пока значение пересчитывает другой процесс, отдаётся старое"""
+        cache.set('key', ('старое', time.time() - 1, 0), 60)
+        cache.add(LOCK_KEY.format('key'), 1)
+        self.assertEqual(get_or_refresh('key', self.compute, 60), 'старое')
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(get_stats()['stale'], 1)
+
+    def test_expired_value_is_refreshed(self):
+        """Истёкшее значение пересчитывается, свежее берётся из кэша"""
+        cache.set('key', ('старое', time.time() - 1, 0), 60)
+        self.assertEqual(get_or_refresh('key', self.compute, 60),
+                         'значение 1')
+        self.assertEqual(get_or_refresh('key', self.compute, 60),
+                         'значение 1')
+        self.assertEqual(get_stats()['hit'], 1)
+
+
+class ReadBeforeWriteCache(TwoTierCache):
+    """Перед каждой записью читает ключ, как параллельный запрос."""
+
+    read_key = None
+
+    def _write(self, statements):
+        if self.read_key is not None:
+            self.get(self.read_key)
+        return super()._write(statements)
+
+
+class TwoTierCacheTest(TestCase):
+    """Два экземпляра над одним файлом изображают два воркера."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        path = os.path.join(self.directory, 'cache.sqlite3')
+        params = {'OPTIONS': {'SYNC_INTERVAL': 0}}
+        self.first = TwoTierCache(path, params)
+        self.second = TwoTierCache(path, params)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_second_read_is_served_from_l1(self):
+        """Значение из общего уровня попадает в LRU процесса"""
+        self.first.set('key', 'значение')
+        self.assertEqual(self.second.get('key'), 'значение')
+        self.assertEqual(self.second.get('key'), 'значение')
+        stats = self.second.process_stats()
+        self.assertEqual((stats['l2_hits'], stats['l1_hits']), (1, 1))
+
+    def test_writes_invalidate_other_workers(self):
+        """Запись и удаление в одном воркере видны в LRU другого"""
+        self.first.set('key', 'старое')
+        self.assertEqual(self.second.get('key'), 'старое')
+        self.first.set('key', 'новое')
+        self.assertEqual(self.second.get('key'), 'новое')
+        self.first.delete('key')
+        self.assertIsNone(self.second.get('key'))
+        self.second.set('other', 1)
+        self.first.clear()
+        self.assertIsNone(self.second.get('other'))
+
+    def test_add_and_incr_are_shared(self):
+        """add и incr атомарны для всех воркеров"""
+        self.assertTrue(self.first.add('lock', 1))
+        self.assertFalse(self.second.add('lock', 1))
+        self.first.set('counter', 1)
+        self.assertEqual(self.second.get('counter'), 1)
+        self.assertEqual(self.first.incr('counter'), 2)
+        self.assertEqual(self.second.incr('counter'), 3)
+        self.assertEqual(self.first.get('counter'), 3)
+        with self.assertRaises(ValueError):
+            self.first.incr('missing')
+
+    def test_read_during_write_does_not_restore_stale_value(self):
+        """Чтение до коммита записи не оставляет старое значение в LRU"""
+        cache = ReadBeforeWriteCache(
+            os.path.join(self.directory, 'cache.sqlite3'),
+            {'OPTIONS': {'SYNC_INTERVAL': 0}})
+        cache.set('key', 1)
+        cache.read_key = 'key'
+        cache.incr('key')
+        self.assertEqual(cache.get('key'), 2)
+        cache.delete('key')
+        self.assertIsNone(cache.get('key'))
+        cache.read_key = None
+        cache.set('key', 1, 60)
+        cache.read_key = 'key'
+        cache.touch('key', 0.05)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('key'))
+
+    def test_expired_value_is_missing(self):
+        """Истёкшее значение не отдаётся ни из одного уровня"""
+        self.first.set('key', 'значение', 0.05)
+        self.assertEqual(self.first.get('key'), 'значение')
+        time.sleep(0.1)
+        self.assertIsNone(self.first.get('key'))
+        self.assertTrue(self.second.add('key', 'новое'))
+
+    def test_tier_stats_are_collected_per_process(self):
+        """Статистика уровней сохраняется в общем файле"""
+        self.first.get('missing')
+        stats = self.second.tier_stats()
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['pid'], os.getpid())
+
+    def test_file_is_private(self):
+        """Каталог и файл кэша доступны только владельцу"""
+        path = os.path.join(self.directory, 'state', 'cache.sqlite3')
+        TwoTierCache(path, {}).set('key', 'значение')
+        self.assertEqual(
+            stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode) & 0o077, 0)
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+
+    def test_foreign_file_is_refused(self):
+        """Файл, открытый на запись другим, бэкенд не открывает"""
+        path = os.path.join(self.directory, 'foreign.sqlite3')
+        open(path, 'w').close()
+        os.chmod(path, 0o666)
+        with self.assertRaises(ImproperlyConfigured):
+            TwoTierCache(path, {}).get('key')
+
+
+class SessionBackendTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='user')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        # Пользователь попадает в кэш при первом запросе.
+        self.authorized_client.get('/')
+
+    def get(self, client):
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get('/')
+        tables = [query['sql'] for query in captured
+                  if '"django_session"' in query['sql']
+                  or 'FROM "auth_user"' in query['sql']]
+        return response, tables
+
+    def test_anonymous_get_creates_no_session(self):
+        """Гость не получает сессию и не обращается к таблице сессий"""
+        response, queries = self.get(Client())
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertEqual(queries, [])
+
+    def test_session_and_user_come_from_cache(self):
+        """Сессия и пользователь авторизованного запроса берутся из кэша"""
+        response, queries = self.get(self.authorized_client)
+        self.assertEqual(response.context['user'], self.user)
+        self.assertEqual(queries, [])
+
+    def test_fresh_session_does_not_write_cache(self):
+        """Непросроченная сессия не открывает запись в общий кэш"""
+        self.authorized_client.get('/')
+        statements = []
+        shared = cache._connection()
+        shared.set_trace_callback(statements.append)
+        try:
+            self.authorized_client.get('/')
+        finally:
+            shared.set_trace_callback(None)
+        self.assertNotIn('BEGIN IMMEDIATE', statements)
+
+    def test_password_change_ends_session(self):
+        """Смена пароля завершает сессию, хотя пользователь в кэше"""
+        self.user.set_password('новый пароль')
+        self.user.save()
+        response, _ = self.get(self.authorized_client)
+        self.assertFalse(response.context['user'].is_authenticated)
+
+    def test_expiry_is_renewed_when_due(self):
+        """Срок сессии продлевается раз в интервал, а не на каждом запросе"""
+        response, _ = self.get(self.authorized_client)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        session_key = self.authorized_client.session.session_key
+        cache.delete(RENEWED_KEY_PREFIX + session_key)
+        response, queries = self.get(self.authorized_client)
+        self.assertIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('UPDATE "django_session"', queries[0])
+        response, queries = self.get(self.authorized_client)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertEqual(queries, [])
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_jobs_run_and_leave_queue(self):
+        """Выполненная задача удаляется из очереди"""
+        record.enqueue(value='раз')
+        record.enqueue(value='два')
+        self.assertEqual(run_pending(), 2)
+        self.assertEqual(CALLS, ['раз', 'два'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_key_deduplicates_waiting_jobs(self):
+        """Задача с ключом не ставится, пока такая же ждёт"""
+        self.assertIsNotNone(record.enqueue(key='k', value=1))
+        self.assertIsNone(record.enqueue(key='k', value=2))
+        claimed, = claim(1)
+        # Взятая задача освобождает ключ: изменение во время выполнения
+        # снова ставит задачу.
+        self.assertIsNotNone(record.enqueue(key='k', value=3))
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_failed_job_is_retried_then_kept(self):
+        """Упавшая задача откладывается, а после последней попытки
+        остаётся в базе с ошибкой"""
+        explode.enqueue()
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.assertEqual(run_pending(), 0)
+        failed = Job.objects.get()
+        self.assertEqual(failed.status, Job.QUEUED)
+        self.assertGreater(failed.run_at, timezone.now())
+        self.assertIn('Сбой', failed.last_error)
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('core.jobs', 'ERROR'):
+            run_pending()
+        failed.refresh_from_db()
+        self.assertEqual(failed.status, Job.FAILED)
+        self.assertEqual(failed.attempts, 2)
+
+    def test_claim_respects_type_concurrency(self):
+        """Задачи типа, у которого заняты все места, не захватываются"""
+        record.enqueue(value=1)
+        record.enqueue(value=2)
+        explode.enqueue()
+        claimed = claim(3, Counter({'core.tests.record': 0}))
+        self.assertEqual([instance.name for instance in claimed],
+                         ['core.tests.record', 'core.tests.explode'])
+
+    def test_expired_lease_is_reclaimed(self):
+        """Задачу упавшего воркера берёт другой после конца аренды"""
+        record.enqueue(value=1)
+        claim(1)
+        self.assertEqual(claim(1), [])
+        Job.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(run_pending(), 1)
+
+    @override_settings(EMAIL_BACKEND='core.mail.QueuedEmailBackend',
+                       QUEUED_EMAIL_BACKEND=('django.core.mail.backends.'
+                                             'locmem.EmailBackend'))
+    def test_password_reset_email_is_queued(self):
+        """Письмо сброса пароля отправляет воркер, а не запрос"""
+        get_user_model().objects.create_user(
+            username='user', email='user@example.com', password='password')
+        self.client.post(reverse('users:password_reset_form'),
+                         {'email': 'user@example.com'})
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(Job.objects.get().name, 'core.mail.send_email')
+        run_pending()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['user@example.com'])
+
+
+class RunWorkersTest(TransactionTestCase):
+    def test_threads_run_queued_jobs(self):
+        """run_workers --burst выполняет очередь в потоках и выходит"""
+        CALLS.clear()
+        for value in range(5):
+            record.enqueue(value=value)
+        out = StringIO()
+        call_command('run_workers', '--burst', '--threads=3', '--poll=0.01',
+                     stdout=out)
+        self.assertEqual(sorted(CALLS), list(range(5)))
+        self.assertIn('Выполнено задач: 5', out.getvalue())
+        self.assertFalse(Job.objects.exists())
+
+
+class SqliteTuningTest(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_new_connections_are_tuned(self):
+        """Соединение Django получает SQLITE_PRAGMAS"""
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('temp_store'), 2)
+        self.assertEqual(self.pragma('busy_timeout'),
+                         settings.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(self.pragma('cache_size'),
+                         settings.SQLITE_PRAGMAS['cache_size'])
+
+    def test_file_database_switches_to_wal(self):
+        """База в файле переводится в режим WAL"""
+        directory = tempfile.mkdtemp()
+        try:
+            database = sqlite3.connect(os.path.join(directory, 'db.sqlite3'),
+                                       isolation_level=None)
+            apply_pragmas(database, settings.SQLITE_PRAGMAS)
+            mode, = database.execute('PRAGMA journal_mode').fetchone()
+            database.close()
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(mode, 'wal')
+
+    def test_optimize_command(self):
+        """optimize_db обновляет статистику и переносит журнал"""
+        out = StringIO()
+        call_command('optimize_db', '--analyze', stdout=out)
+        self.assertIn('Статистика обновлена', out.getvalue())
+        self.assertIn('Журнал WAL', out.getvalue())
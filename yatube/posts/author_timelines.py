@@ -0,0 +1,108 @@
+import heapq
+from collections import deque
+from itertools import dropwhile, islice, takewhile
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.cache import get_generations
+
+from .models import Follow, Post
+from .utils import POST_PER_PAGE, CursorPaginator, InvalidCursor
+
+AUTHOR_TIMELINE_KEY = 'author_timeline:{}:{}'
+
+
+def _cache_keys(author_ids):
+    """Ключи списков авторов. В ключ входит поколение ``author:<id>``,
+    которое меняет каждое сохранение и удаление поста автора, поэтому
+    списки не правятся на месте: изменение поста просто делает прежний
+    ключ ненужным, и он уходит по TTL."""
+    scopes = {author_id: f'author:{author_id}' for author_id in author_ids}
+    generations = get_generations(scopes.values())
+    return {
+        AUTHOR_TIMELINE_KEY.format(author_id, generations[scope]): author_id
+        for author_id, scope in scopes.items()}
+
+
+def _load(author_id):
+    return list(
+        Post.objects.filter(author_id=author_id)
+        .order_by('-pub_date', '-id')
+        .values_list('pub_date', 'id')[:settings.AUTHOR_TIMELINE_LENGTH])
+
+
+def get_author_timelines(author_ids):
+    """Возвращает {author_id: [(pub_date, post_id), ...]} по убыванию даты.
+
+    Отсутствующие в кэше списки читаются из базы и кладутся в кэш.
+    """
+    keys = _cache_keys(author_ids)
+    cached = cache.get_many(keys)
+    timelines = {keys[key]: value for key, value in cached.items()}
+    missing = {}
+    for key, author_id in keys.items():
+        if key not in cached:
+            timelines[author_id] = missing[key] = _load(author_id)
+    if missing:
+        cache.set_many(missing, settings.AUTHOR_TIMELINE_TIMEOUT)
+    return timelines
+
+
+def get_merged_page(request, user):
+    """Страница ленты подписок, собранная k-way слиянием
+    закэшированных списков авторов.
+
+    Слияние точно только не ниже «пола» — самой свежей из последних
+    записей усечённых списков. Страницы глубже читаются из базы
+    обычным запросом по подпискам.
+    """
+    queryset = Post.objects.for_listing().filter(
+        author__following__user=user)
+    paginator = CursorPaginator(queryset, POST_PER_PAGE)
+    author_ids = list(Follow.objects.filter(user=user).values_list(
+        'author_id', flat=True))
+    timelines = list(get_author_timelines(author_ids).values())
+    truncated = [items[-1] for items in timelines
+                 if len(items) >= settings.AUTHOR_TIMELINE_LENGTH]
+    floor = max(truncated) if truncated else None
+
+    cursor = request.GET.get('cursor')
+    number, backwards, boundary = 1, False, None
+    if cursor:
+        try:
+            number, backwards, boundary = paginator.decode_cursor(cursor)
+            boundary = tuple(boundary)
+        except InvalidCursor:
+            cursor = None
+    if floor is not None and boundary is not None and boundary < floor:
+        return paginator.get_page(cursor)
+
+    merged = heapq.merge(*timelines, reverse=True)
+    if backwards:
+        newer = takewhile(lambda item: item > boundary, merged)
+        window = list(deque(newer, maxlen=POST_PER_PAGE + 1))
+        if len(window) > POST_PER_PAGE:
+            return _page_from_window(paginator, window[1:], number,
+                                     cursor, True, True)
+        # Дошли до начала ленты: первая страница всегда полная.
+        number, boundary, cursor = 1, None, None
+        merged = heapq.merge(*timelines, reverse=True)
+    if boundary is not None:
+        merged = dropwhile(lambda item: item >= boundary, merged)
+    window = list(islice(merged, POST_PER_PAGE + 1))
+    has_next = len(window) > POST_PER_PAGE
+    window = window[:POST_PER_PAGE]
+    if floor is not None and not (has_next and window[-1] >= floor):
+        return paginator.get_page(cursor)
+    return _page_from_window(paginator, window, number, cursor, has_next,
+                             boundary is not None)
+
+
+def _page_from_window(paginator, window, number, cursor, has_next,
+                      has_previous):
+    post_ids = [post_id for _, post_id in window]
+    posts = Post.objects.for_listing().order_by().in_bulk(post_ids)
+    items = [posts[post_id] for post_id in post_ids if post_id in posts]
+    return paginator.build_page(items, number, cursor, has_next,
+                                has_previous)
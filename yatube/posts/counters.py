@@ -0,0 +1,165 @@
+import threading
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Comment, Follow, MediaFile, Post, User, UserCounters
+from .object_cache import forget_pk
+
+USER_COUNTERS = ('posts_count', 'followers_count', 'following_count')
+
+
+# Пользователи, которых удаляет текущий поток: их счётчики удалятся
+# каскадом, а каскадные удаления постов и подписок не должны их менять.
+_deleting = threading.local()
+
+
+def _deleting_users():
+    if not hasattr(_deleting, 'user_ids'):
+        _deleting.user_ids = set()
+    return _deleting.user_ids
+
+
+def user_deleting(user_id):
+    _deleting_users().add(user_id)
+
+
+def user_deleted(user_id):
+    _deleting_users().discard(user_id)
+
+
+def _decrease(name, delta):
+    # Разошедшийся счётчик останавливается на нуле, а не нарушает CHECK.
+    return Greatest(F(name) + delta, 0)
+
+
+def bump_user(user_id, **deltas):
+    """Атомарно прибавляет ``deltas`` к счётчикам пользователя.
+
+    Уменьшение не создаёт строку счётчиков: оно приходит и от каскадного
+    удаления, когда пользователя в базе уже может не быть.
+    """
+    if user_id in _deleting_users():
+        return
+    if any(delta < 0 for delta in deltas.values()):
+        UserCounters.objects.filter(user_id=user_id).update(
+            **{name: _decrease(name, delta)
+               for name, delta in deltas.items()})
+        forget_pk(User, user_id)
+        return
+    changes = {name: F(name) + delta for name, delta in deltas.items()}
+    if not UserCounters.objects.filter(user_id=user_id).update(**changes):
+        try:
+            with transaction.atomic():
+                UserCounters.objects.create(user_id=user_id, **deltas)
+        except IntegrityError:
+            # Строку успел создать параллельный запрос.
+            UserCounters.objects.filter(user_id=user_id).update(**changes)
+    # Счётчики кэшируются вместе с пользователем.
+    forget_pk(User, user_id)
+
+
+def bump_comments(post_id, delta):
+    count = (_decrease('comments_count', delta) if delta < 0
+             else F('comments_count') + delta)
+    Post.objects.filter(id=post_id).update(comments_count=count)
+    forget_pk(Post, post_id)
+
+
+def bump_media(name, delta):
+    """Атомарно меняет число постов, ссылающихся на файл ``name``.
+    Файл без ссылок получает отметку ``released`` для collect_media."""
+    if delta > 0:
+        changes = {'references': F('references') + delta, 'released': None}
+        if not MediaFile.objects.filter(name=name).update(**changes):
+            try:
+                with transaction.atomic():
+                    MediaFile.objects.create(name=name, references=delta)
+            except IntegrityError:
+                MediaFile.objects.filter(name=name).update(**changes)
+        return
+    MediaFile.objects.filter(name=name, references__gte=-delta).update(
+        references=F('references') + delta)
+    MediaFile.objects.filter(name=name, references=0,
+                             released__isnull=True).update(
+        released=timezone.now())
+
+
+def counters_for(user):
+    """Счётчики пользователя; для нового пользователя — нули."""
+    try:
+        return user.counters
+    except UserCounters.DoesNotExist:
+        return UserCounters(user=user)
+
+
+def _grouped(queryset, field):
+    return dict(queryset.values_list(field).annotate(total=Count('id'))
+                .order_by())
+
+
+def reconcile():
+    """Пересчитывает счётчики по таблицам и исправляет расхождения.
+
+    Возвращает число исправленных строк пользователей и постов.
+    """
+    actual = {
+        'posts_count': _grouped(Post.objects, 'author_id'),
+        'followers_count': _grouped(Follow.objects, 'author_id'),
+        'following_count': _grouped(Follow.objects, 'user_id'),
+    }
+    stored = UserCounters.objects.in_bulk()
+    fixed_users = []
+    for user_id in User.objects.values_list('id', flat=True).iterator():
+        expected = {name: actual[name].get(user_id, 0)
+                    for name in USER_COUNTERS}
+        counters = stored.get(user_id)
+        if counters is None:
+            if any(expected.values()):
+                fixed_users.append(UserCounters(user_id=user_id, **expected))
+            continue
+        if any(getattr(counters, name) != value
+               for name, value in expected.items()):
+            for name, value in expected.items():
+                setattr(counters, name, value)
+            counters.save(update_fields=USER_COUNTERS)
+            fixed_users.append(counters)
+    UserCounters.objects.bulk_create(
+        [counters for counters in fixed_users if counters.pk not in stored],
+        ignore_conflicts=True)
+
+    forget_pk(User, *(counters.user_id for counters in fixed_users))
+
+    comments = _grouped(Comment.objects, 'post_id')
+    fixed_posts = []
+    for post_id, stored_count in Post.objects.values_list(
+            'id', 'comments_count').iterator():
+        expected = comments.get(post_id, 0)
+        if stored_count != expected:
+            Post.objects.filter(id=post_id).update(comments_count=expected)
+            fixed_posts.append(post_id)
+    forget_pk(Post, *fixed_posts)
+    return len(fixed_users), len(fixed_posts)
+
+
+def reconcile_media():
+    """Пересчитывает ссылки на файлы картинок по таблице постов.
+
+    Возвращает число исправленных и добавленных строк ``MediaFile``.
+    """
+    actual = _grouped(Post.objects.exclude(image=''), 'image')
+    fixed = 0
+    for media in MediaFile.objects.iterator():
+        expected = actual.pop(media.name, 0)
+        if media.references != expected:
+            media.references = expected
+            media.released = None if expected else timezone.now()
+            media.save(update_fields=('references', 'released'))
+            fixed += 1
+    MediaFile.objects.bulk_create(
+        [MediaFile(name=name, references=total)
+         for name, total in actual.items()],
+        ignore_conflicts=True)
+    return fixed + len(actual)
@@ -0,0 +1,283 @@
+"""Какие username, slug групп и id постов точно не существуют.
+
+Каждый процесс держит в памяти фильтр Блума username и slug и
+наибольший id поста и строит их при первом обращении. Созданные
+объекты записываются в журнал в общем кэше: счётчик ``EXISTS_COUNTER``
+нумерует записи, ``EXISTS_ENTRY`` хранит значения. Прежде чем ответить
+«точно нет», процесс дочитывает журнал; если записи успели вытесниться,
+фильтр строится заново. Строки, созданные в обход сигналов
+(``bulk_create``, ``loaddata``), фильтр увидит после перестройки раз
+в ``settings.EXISTENCE_REBUILD_INTERVAL`` секунд. Плановая перестройка
+идёт в фоновом потоке, а запросы до замены отвечают по старому фильтру.
+"""
+import hashlib
+import math
+from abc import ABC, abstractmethod
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Max
+
+from .models import Group, Post, User
+
+EXISTS_COUNTER = 'exists:{}'
+EXISTS_ENTRY = 'exists:{}:{}'
+JOURNAL_TIMEOUT = 60 * 60
+# Сколько записей журнала дочитывать; при большем отставании фильтр
+# дешевле построить заново.
+MAX_JOURNAL_READ = 1000
+MIN_CAPACITY = 1000
+ERROR_RATE = 0.01
+
+
+class BloomFilter:
+    """Множество без ложноотрицательных ответов: ``value in bloom``
+    может ошибиться только в сторону «есть»."""
+
+    def __init__(self, capacity, error_rate=ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate)
+                               / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Двойное хэширование: k позиций из двух половин одного дайджеста.
+        digest = hashlib.blake2b(str(value).encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & 1 << (position & 7)
+                   for position in self._positions(value))
+
+
+class ExistenceIndex(ABC):
+    """Журналируемое множество существующих значений одного поля."""
+
+    def __init__(self, name):
+        self.name = name
+        self.counter_key = EXISTS_COUNTER.format(name)
+        self.lock = threading.Lock()
+        self.seen = None
+        self.built = 0.0
+        self.rebuilding = None
+
+    @abstractmethod
+    def load(self):
+        """Читает значения из базы и возвращает новое множество."""
+
+    @abstractmethod
+    def install(self, loaded):
+        """Заменяет множество построенным в ``load``."""
+
+    @abstractmethod
+    def is_loaded(self):
+        """Построено ли множество."""
+
+    @abstractmethod
+    def add(self, value):
+        """Добавляет значение из журнала."""
+
+    @abstractmethod
+    def contains(self, value):
+        """False, если значения точно нет."""
+
+    def is_full(self):
+        return False
+
+    @abstractmethod
+    def reset(self):
+        """Забывает построенное множество."""
+
+    def _build(self):
+        # Номер журнала берётся до чтения базы: записи, сделанные во время
+        # чтения, будут применены ещё раз, а это безопасно.
+        self.seen = cache.get(self.counter_key)
+        self.install(self.load())
+        self.built = time.monotonic()
+
+    def _rebuild_in_background(self):
+        """Запускает перестройку в отдельном потоке; вызывается под
+        ``self.lock``."""
+        if self.rebuilding is not None and self.rebuilding.is_alive():
+            return
+        self.rebuilding = threading.Thread(
+            target=self._rebuild, name=f'existence-{self.name}', daemon=True)
+        self.rebuilding.start()
+
+    def _rebuild(self):
+        try:
+            seen = cache.get(self.counter_key)
+            loaded = self.load()
+            with self.lock:
+                # После reset() фильтр построит первый же запрос.
+                if self.is_loaded():
+                    self.seen = seen
+                    self.install(loaded)
+                    self.built = time.monotonic()
+        finally:
+            connections.close_all()
+
+    def _catch_up(self):
+        current = cache.get(self.counter_key)
+        if current is None or current == self.seen:
+            return
+        lag = current - self.seen if self.seen is not None else None
+        if lag is None or not 0 < lag <= MAX_JOURNAL_READ:
+            self._build()
+            return
+        keys = [EXISTS_ENTRY.format(self.name, number)
+                for number in range(self.seen + 1, current + 1)]
+        values = cache.get_many(keys)
+        if len(values) < len(keys):
+            self._build()
+            return
+        for value in values.values():
+            self.add(value)
+        self.seen = current
+        if self.is_full():
+            self._build()
+
+    def might_exist(self, value):
+        """False, только если значения точно нет в базе."""
+        with self.lock:
+            if not self.is_loaded():
+                self._build()
+            elif (time.monotonic() - self.built
+                    >= settings.EXISTENCE_REBUILD_INTERVAL):
+                self._rebuild_in_background()
+            if self.contains(value):
+                return True
+            self._catch_up()
+            return self.contains(value)
+
+    def record(self, value):
+        """Добавляет новое значение в фильтр процесса сразу, а в журнал
+        для остальных процессов — после фиксации транзакции: иначе
+        перестроенный по журналу фильтр мог бы не увидеть строку."""
+        with self.lock:
+            if self.is_loaded():
+                self.add(value)
+        transaction.on_commit(lambda: self._journal(value))
+
+    def _journal(self, value):
+        number = time.time_ns()
+        if not cache.add(self.counter_key, number, None):
+            try:
+                number = cache.incr(self.counter_key)
+            except ValueError:
+                # Счётчик вытеснили между add и incr: процессы с прежним
+                # номером заметят разрыв и перестроят фильтр.
+                number = time.time_ns()
+                cache.set(self.counter_key, number, None)
+        cache.set(EXISTS_ENTRY.format(self.name, number), value,
+                  JOURNAL_TIMEOUT)
+
+
+class KeyIndex(ExistenceIndex):
+    """Фильтр Блума значений ``field`` модели ``model``."""
+
+    def __init__(self, name, model, field):
+        super().__init__(name)
+        self.model = model
+        self.field = field
+        self.bloom = None
+
+    def load(self):
+        values = list(self.model._default_manager.values_list(
+            self.field, flat=True).iterator())
+        # Запас, чтобы новые значения не переполняли фильтр сразу.
+        bloom = BloomFilter(2 * len(values) + MIN_CAPACITY)
+        for value in values:
+            bloom.add(value)
+        return bloom
+
+    def install(self, loaded):
+        self.bloom = loaded
+
+    def is_loaded(self):
+        return self.bloom is not None
+
+    def add(self, value):
+        self.bloom.add(value)
+
+    def contains(self, value):
+        return value in self.bloom
+
+    def is_full(self):
+        return self.bloom.count > self.bloom.capacity
+
+    def reset(self):
+        with self.lock:
+            self.seen = self.bloom = None
+
+
+class IdRangeIndex(ExistenceIndex):
+    """Диапазон первичных ключей: id больше наибольшего точно нет."""
+
+    def __init__(self, name, model):
+        super().__init__(name)
+        self.model = model
+        self.max_id = None
+
+    def load(self):
+        return self.model._default_manager.aggregate(
+            max_id=Max('pk'))['max_id'] or 0
+
+    def install(self, loaded):
+        self.max_id = loaded
+
+    def is_loaded(self):
+        return self.max_id is not None
+
+    def add(self, value):
+        self.max_id = max(self.max_id, value)
+
+    def contains(self, value):
+        return 0 < value <= self.max_id
+
+    def reset(self):
+        with self.lock:
+            self.seen = self.max_id = None
+
+
+INDEXES = {
+    (User, 'username'): KeyIndex('usernames', User, 'username'),
+    (Group, 'slug'): KeyIndex('group_slugs', Group, 'slug'),
+    (Post, 'pk'): IdRangeIndex('post_ids', Post),
+}
+
+
+def might_exist(model, field, value):
+    """False, если объекта с таким значением поля точно нет."""
+    index = INDEXES.get((model, field))
+    return index is None or index.might_exist(value)
+
+
+def record(model, field, value):
+    index = INDEXES.get((model, field))
+    if index is not None:
+        index.record(value)
+
+
+def build():
+    """Строит фильтры заранее, например при старте воркера."""
+    for index in INDEXES.values():
+        with index.lock:
+            index._build()
+
+
+def reset():
+    for index in INDEXES.values():
+        index.reset()
@@ -1,11 +1,39 @@
 from django import forms
+from .images import ImageRejected, ingest, too_large
 from .models import Post, Comment
 
 
+class IngestedImageField(forms.ImageField):
+    """Картинка, проверенная и при необходимости уменьшенная
+    ``posts.images.ingest``, а не Pillow в потоке запроса."""
+
+    def to_python(self, data):
+        data = forms.FileField.to_python(self, data)
+        if data is None:
+            return None
+        try:
+            return ingest(data)
+        except ImageRejected as error:
+            raise forms.ValidationError(str(error), code='invalid_image')
+
+
 class PostForm(forms.ModelForm):
     class Meta:
         model = Post
         fields = ("text", "group", 'image',)
+        field_classes = {'image': IngestedImageField}
+
+    def __init__(self, *args, upload_oversized=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Загрузку больше лимита оборвал LimitedUploadHandler, и файла
+        # в форме нет.
+        self.upload_oversized = upload_oversized
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.upload_oversized:
+            self.add_error('image', str(too_large()))
+        return cleaned_data
 
     def clean_text(self):
         data = self.cleaned_data["text"]
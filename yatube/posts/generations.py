@@ -0,0 +1,120 @@
+"""Поколения кэша фрагментов и ETag страниц.
+
+Поколение входит в ключ ``{% cache %}`` и в ETag и меняется сигналами
+при изменении постов, групп, авторов, комментариев и подписок, поэтому
+фрагменты можно хранить долго, а неизменившиеся страницы отдавать 304.
+"""
+import hashlib
+
+from core.cache import bump_generation, get_generation
+
+from .models import Group, Post, User
+from .object_cache import get_cached
+
+# Поля пользователя, которые выводятся в карточке поста.
+USER_CARD_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+def index_generation():
+    return get_generation('posts', 'users', 'groups')
+
+
+def group_generation(group):
+    return get_generation(f'group:{group.pk}', 'users')
+
+
+def author_generation(author):
+    return get_generation(f'author:{author.pk}', 'groups')
+
+
+def card_generation():
+    """Поколение карточек постов: имена авторов и адреса групп.
+
+    Текст и картинку карточки версионирует ``Post.modified``.
+    """
+    return get_generation('users', 'groups')
+
+
+def post_changed(post, previous_group_id=None):
+    groups = {post.group_id, previous_group_id} - {None}
+    bump_generation('posts', f'author:{post.author_id}', f'post:{post.pk}',
+                    *(f'group:{group_id}' for group_id in groups))
+
+
+def comments_changed(comment):
+    bump_generation(f'post:{comment.post_id}')
+
+
+def follow_changed(follow):
+    bump_generation(f'followers:{follow.author_id}',
+                    f'following:{follow.user_id}')
+
+
+def timelines_changed(user_ids):
+    bump_generation(*(f'following:{user_id}' for user_id in user_ids))
+
+
+def group_changed(group):
+    bump_generation('groups', f'group:{group.pk}')
+
+
+def user_changed(user, previous):
+    """``previous`` — поля карточки из базы до сохранения или ``None``,
+    если сохранение их не затрагивало."""
+    if previous is None or all(
+            getattr(user, field) == previous[field]
+            for field in USER_CARD_FIELDS):
+        return
+    bump_generation('users', f'author:{user.pk}')
+
+
+def _etag(request, generation):
+    """ETag страницы: поколение её данных, параметры страницы и зритель.
+
+    Шапка и формы зависят от пользователя, поэтому для каждого
+    пользователя ETag свой, а ответы помечаются ``Vary: Cookie``.
+    """
+    viewer = request.user.pk if request.user.is_authenticated else 'anon'
+    raw = f'{generation}|{request.GET.urlencode()}|{viewer}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def index_etag(request):
+    return _etag(request, index_generation())
+
+
+def group_etag(request, slug):
+    group = get_cached(Group, slug=slug)
+    if group is None:
+        return None
+    return _etag(request, group_generation(group))
+
+
+def profile_etag(request, username):
+    author = get_cached(User, username=username)
+    if author is None:
+        return None
+    # Профиль выводит число подписчиков и подписок автора.
+    return _etag(request, '|'.join((
+        author_generation(author),
+        get_generation(f'followers:{author.pk}', f'following:{author.pk}'))))
+
+
+def post_etag(request, post_id):
+    post = get_cached(Post, pk=post_id)
+    if post is None:
+        return None
+    # 'users': под постом выводятся имена комментаторов.
+    scopes = [f'post:{post_id}', f'author:{post.author_id}', 'users']
+    if post.group_id is not None:
+        scopes.append(f'group:{post.group_id}')
+    return _etag(request, get_generation(*scopes))
+
+
+def comments_etag(request, post_id):
+    return _etag(request, get_generation(f'post:{post_id}', 'users'))
+
+
+def follow_etag(request):
+    return _etag(request, get_generation(
+        'posts', 'users', 'groups', f'following:{request.user.pk}'))
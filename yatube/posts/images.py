@@ -0,0 +1,192 @@
+"""Приём картинок постов и сведения о них, которые считаются один раз
+при загрузке.
+
+Загрузка пишется во временный файл (``posts.uploads``), а разбор
+запроса обрывается на ``POST_IMAGE_MAX_BYTES``. Затем ``ingest`` читает
+только заголовок картинки, отклоняет слишком большие по числу пикселей
+(в том числе «бомбы», у которых маленький файл объявляет огромное
+изображение) и отдаёт полное декодирование отдельному процессу
+с тайм-аутом: зависшее декодирование завершается, не задевая другие
+загрузки. Картинки больше ``POST_IMAGE_MAX_SIDE`` по любой стороне
+уменьшаются там же, и в хранилище попадает уже уменьшенная копия.
+"""
+import base64
+import logging
+import multiprocessing
+import threading
+import warnings
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Качество, с которым пересохраняются уменьшенные JPEG и WebP.
+DOWNSCALE_QUALITY = 90
+INVALID_IMAGE = ('Загрузите правильное изображение. Файл, который вы '
+                 'загрузили, поврежден или не является изображением.')
+BOMB = 'Картинка распаковывается в слишком большое изображение.'
+
+# Ширина и качество заглушки: в data: URI она занимает несколько
+# сотен байт, а браузер растягивает её с размытием.
+PLACEHOLDER_WIDTH = 16
+PLACEHOLDER_QUALITY = 40
+
+
+def tiny_placeholder(file_):
+    """data: URI уменьшенной до ``PLACEHOLDER_WIDTH`` пикселей копии
+    картинки в WebP или пустая строка, если картинку не прочитать."""
+    try:
+        file_.seek(0)
+        with Image.open(file_) as image:
+            # Для JPEG декодирует сразу в уменьшенном масштабе.
+            image.draft('RGB', (PLACEHOLDER_WIDTH * 4, PLACEHOLDER_WIDTH * 4))
+            image = image.convert('RGB')
+            image.thumbnail((PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH))
+            buffer = BytesIO()
+            image.save(buffer, 'WEBP', quality=PLACEHOLDER_QUALITY)
+    except (OSError, ValueError) as error:
+        logger.warning('Не удалось построить заглушку %s: %s', file_, error)
+        return ''
+    finally:
+        file_.seek(0)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/webp;base64,{encoded}'
+
+
+class ImageRejected(Exception):
+    """Картинку нельзя принять; текст исключения показывается автору."""
+
+
+def too_large():
+    limit = settings.POST_IMAGE_MAX_BYTES // (1024 * 1024)
+    return ImageRejected(f'Файл больше {limit} МБ.')
+
+
+def _open(source):
+    image = Image.open(source if isinstance(source, str) else BytesIO(source))
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        image.close()
+        megapixels = settings.POST_IMAGE_MAX_PIXELS / 10 ** 6
+        raise ImageRejected(
+            f'Картинка {width}×{height} слишком большая: допустимо '
+            f'не более {megapixels:g} мегапикселей.')
+    return image
+
+
+def _decode(source, max_side):
+    """Полностью декодирует картинку и, если она больше ``max_side``,
+    уменьшает. Возвращает ``(данные или None, размер)``. Выполняется
+    в отдельном процессе."""
+    # Декодер Pillow сам отказывается от «бомб» вдвое больше лимита,
+    # а от меньших только предупреждает: здесь это тоже отказ.
+    Image.MAX_IMAGE_PIXELS = settings.POST_IMAGE_MAX_PIXELS
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', Image.DecompressionBombWarning)
+        try:
+            with _open(source) as image:
+                format_ = image.format
+                image.load()
+                if max(image.size) <= max_side:
+                    return None, image.size
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((max_side, max_side), Image.LANCZOS)
+                buffer = BytesIO()
+                image.save(buffer, format_, quality=DOWNSCALE_QUALITY)
+                return buffer.getvalue(), image.size
+        except (Image.DecompressionBombWarning,
+                Image.DecompressionBombError):
+            raise ImageRejected(BOMB)
+        except (OSError, SyntaxError, ValueError):
+            raise ImageRejected(INVALID_IMAGE)
+
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def _get_slots():
+    """Семафор на ``IMAGE_INGEST_PROCESSES`` одновременных декодирований."""
+    global _slots
+    count = settings.IMAGE_INGEST_PROCESSES
+    with _slots_lock:
+        if _slots is None or _slots[0] != count:
+            _slots = count, threading.BoundedSemaphore(count)
+        return _slots[1]
+
+
+def _decode_in_child(connection, source, max_side):
+    try:
+        connection.send((True, _decode(source, max_side)))
+    except ImageRejected as error:
+        connection.send((False, str(error)))
+    finally:
+        connection.close()
+
+
+def _decode_with_timeout(source):
+    """Декодирует картинку в своём процессе; зависший процесс
+    завершается по тайм-ауту, другие декодирования он не задевает."""
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    if not settings.IMAGE_INGEST_PROCESSES:
+        return _decode(source, max_side)
+    slots = _get_slots()
+    if not slots.acquire(timeout=settings.IMAGE_INGEST_TIMEOUT):
+        raise ImageRejected('Сервер занят, попробуйте ещё раз.')
+    try:
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.get_context('fork').Process(
+            target=_decode_in_child, args=(sender, source, max_side),
+            daemon=True)
+        process.start()
+        sender.close()
+        try:
+            # Результат читается до join: большой ответ не поместится
+            # в буфер канала, и процесс не завершится, пока его не прочтут.
+            if not receiver.poll(settings.IMAGE_INGEST_TIMEOUT):
+                process.terminate()
+                raise ImageRejected('Картинка обрабатывается слишком долго.')
+            succeeded, result = receiver.recv()
+        except EOFError:
+            raise ImageRejected('Не удалось обработать картинку, '
+                                'попробуйте ещё раз.')
+        finally:
+            receiver.close()
+            process.join()
+    finally:
+        slots.release()
+    if not succeeded:
+        raise ImageRejected(result)
+    return result
+
+
+def ingest(file_):
+    """Проверяет загруженную картинку и возвращает файл для хранилища:
+    тот же или уменьшенную копию. Бросает ``ImageRejected``."""
+    if file_.size > settings.POST_IMAGE_MAX_BYTES:
+        raise too_large()
+    if hasattr(file_, 'temporary_file_path'):
+        source = file_.temporary_file_path()
+    else:
+        file_.seek(0)
+        source = file_.read()
+        file_.seek(0)
+    # Заголовок читается здесь: огромную картинку незачем даже
+    # отправлять в пул. Предупреждение Pillow о «бомбе» не нужно:
+    # размер проверяет ``_open``.
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+        try:
+            _open(source).close()
+        except Image.DecompressionBombError:
+            raise ImageRejected(BOMB)
+        except (OSError, SyntaxError, ValueError):
+            raise ImageRejected(INVALID_IMAGE)
+    data, _ = _decode_with_timeout(source)
+    if data is None:
+        return file_
+    logger.info('Картинка %s уменьшена при загрузке', file_.name)
+    return ContentFile(data, name=file_.name)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import timeline
+from posts.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Заполняет ленты подписок по существующим подпискам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', action='append', default=[],
+                            help='Пересобрать ленту только этого читателя.')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Предварительно очистить ленты.')
+
+    def handle(self, *args, **options):
+        follows = Follow.objects.order_by('user_id', 'author_id')
+        if options['username']:
+            follows = follows.filter(user__username__in=options['username'])
+        pairs = list(follows.values_list('user_id', 'author_id'))
+        readers = {user_id for user_id, _ in pairs}
+        if options['rebuild']:
+            TimelineEntry.objects.filter(user_id__in=readers).delete()
+        for user_id, author_id in pairs:
+            with transaction.atomic():
+                timeline.add_author(user_id, author_id)
+        self.stdout.write(
+            f'Обработано подписок: {len(pairs)}, лент: {len(readers)}')
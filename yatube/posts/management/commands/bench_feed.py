@@ -0,0 +1,76 @@
+from time import perf_counter
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from posts import timeline
+from posts.author_timelines import get_merged_page
+from posts.models import Follow, Post, User
+from posts.utils import POST_PER_PAGE, CursorPaginator
+
+READER_USERNAME = 'bench_feed_reader'
+AUTHOR_USERNAME = 'bench_feed_author_{}'
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает ленту подписок через JOIN по author__following__user '
+            'со слиянием закэшированных лент авторов и с материализованной '
+            'лентой читателя.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=300,
+                            help='Сколько авторов читает пользователь.')
+        parser.add_argument('--posts', type=int, default=20,
+                            help='Сколько постов у каждого автора.')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Сколько раз повторить каждый замер.')
+
+    def handle(self, *args, **options):
+        reader = self.seed(options['authors'], options['posts'])
+        request = RequestFactory().get('/follow/')
+
+        def join_page():
+            queryset = Post.objects.filter(author__following__user=reader)
+            return CursorPaginator(queryset, POST_PER_PAGE).get_page(None)
+
+        cache.clear()
+        cases = (
+            ('join', join_page),
+            ('merge, холодный кэш', lambda: get_merged_page(request, reader)),
+            ('merge, тёплый кэш', lambda: get_merged_page(request, reader)),
+            ('timeline', lambda: timeline.get_timeline_page(request, reader)),
+        )
+        for title, build_page in cases:
+            repeat = 1 if 'холодный' in title else options['repeat']
+            best, queries = self.measure(build_page, repeat)
+            self.stdout.write(
+                f'{title:<22} {best * 1000:9.2f} мс  запросов: {queries}')
+
+    def measure(self, build_page, repeat):
+        best = None
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                started = perf_counter()
+                list(build_page().object_list)
+                elapsed = perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, len(captured)
+
+    def seed(self, authors_count, posts_count):
+        reader, _ = User.objects.get_or_create(username=READER_USERNAME)
+        for number in range(authors_count):
+            author, created = User.objects.get_or_create(
+                username=AUTHOR_USERNAME.format(number))
+            if not created:
+                continue
+            Post.objects.bulk_create(
+                Post(author=author, text=f'Пост {i} автора {number}')
+                for i in range(posts_count))
+            # bulk_create не шлёт сигналов, ленту читателя заполняем явно.
+            with override_settings(FOLLOW_FEED='merge'):
+                Follow.objects.create(user=reader, author=author)
+            timeline.add_author(reader.id, author.id)
+        return reader
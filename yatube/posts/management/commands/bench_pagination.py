@@ -0,0 +1,83 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+
+from posts.models import Post, User
+from posts.utils import POST_ORDERING, POST_PER_PAGE, CursorPaginator
+
+BENCH_USERNAME = 'bench_author'
+SEED_BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает OFFSET-пагинацию и пагинацию по курсору '
+            'на первой и на глубокой странице ленты.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', type=int, default=5000,
+                            help='Номер глубокой страницы.')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Сколько раз повторить каждый замер.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Досоздать постов до указанного числа.')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'])
+        deep_page = options['page']
+        if deep_page < 2:
+            raise CommandError('Глубокая страница должна быть не меньше 2.')
+        queryset = Post.objects.all()
+        offset = (deep_page - 1) * POST_PER_PAGE
+        anchor = queryset.order_by(*POST_ORDERING)[offset - 1:offset].first()
+        if anchor is None:
+            raise CommandError(
+                f'Для страницы {deep_page} нужно больше {offset} постов, '
+                f'запустите команду с --seed {offset + POST_PER_PAGE}.')
+
+        cursor_paginator = CursorPaginator(queryset, POST_PER_PAGE)
+        cursor = cursor_paginator.encode_cursor(anchor, deep_page)
+        cases = (
+            ('offset, стр. 1',
+             lambda: Paginator(queryset, POST_PER_PAGE).get_page(1)),
+            (f'offset, стр. {deep_page}',
+             lambda: Paginator(queryset, POST_PER_PAGE).get_page(deep_page)),
+            ('cursor, стр. 1',
+             lambda: CursorPaginator(queryset, POST_PER_PAGE).get_page(None)),
+            (f'cursor, стр. {deep_page}',
+             lambda: CursorPaginator(queryset, POST_PER_PAGE).get_page(
+                 cursor)),
+        )
+        for title, build_page in cases:
+            best, queries = self.measure(build_page, options['repeat'])
+            self.stdout.write(
+                f'{title:<24} {best * 1000:9.2f} мс  запросов: {queries}')
+
+    def measure(self, build_page, repeat):
+        best = None
+        for _ in range(repeat):
+            reset_queries()
+            with CaptureQueriesContext(connection) as captured:
+                started = perf_counter()
+                page = build_page()
+                list(page.object_list)
+                page.has_next()
+                elapsed = perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, len(captured)
+
+    def seed(self, total):
+        missing = total - Post.objects.count()
+        if missing <= 0:
+            return
+        author, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+        while missing > 0:
+            batch = min(missing, SEED_BATCH_SIZE)
+            Post.objects.bulk_create(
+                Post(author=author, text='Пост для замера пагинации')
+                for _ in range(batch))
+            missing -= batch
+        self.stdout.write(f'Постов в базе: {Post.objects.count()}')
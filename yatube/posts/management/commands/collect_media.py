@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from posts.counters import reconcile_media
+from posts.models import MediaFile, Post
+
+
+def walk(storage, path):
+    """Имена всех файлов хранилища в каталоге ``path``."""
+    if not storage.exists(path):
+        return
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield f'{path}/{name}'
+    for directory in directories:
+        yield from walk(storage, f'{path}/{directory}')
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки постов, на которые не ссылается ни один '
+            'пост, вместе с их миниатюрами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=float,
+            default=settings.MEDIA_GC_GRACE / 3600,
+            help='Сколько часов файл без ссылок хранится до удаления.')
+        parser.add_argument('--reconcile', action='store_true',
+                            help='Сначала пересчитать ссылки по постам.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет удалено.')
+
+    def handle(self, *args, **options):
+        field = Post._meta.get_field('image')
+        storage = field.storage
+        if options['reconcile']:
+            fixed = reconcile_media()
+            self.stdout.write(f'Исправлено счётчиков ссылок: {fixed}')
+        cutoff = timezone.now() - timedelta(hours=options['grace'])
+        media = MediaFile.objects.in_bulk(field_name='name')
+        # Таблица постов — последняя проверка: разошедшийся счётчик
+        # не должен стоить картинки живому посту.
+        referenced = set(Post.objects.exclude(image='').values_list(
+            'image', flat=True).distinct())
+        removed = freed = 0
+        for name in walk(storage, field.upload_to.strip('/')):
+            row = media.get(name)
+            if name in referenced or row is not None and (
+                    row.references or row.released is None
+                    or row.released > cutoff):
+                continue
+            # Время изменения обновляет повторная загрузка того же файла.
+            if storage.get_modified_time(name) > cutoff:
+                continue
+            freed += storage.size(name)
+            removed += 1
+            self.stdout.write(f'Удаляется {name}')
+            if options['dry_run']:
+                continue
+            default.kvstore.delete(ImageFile(name, storage))
+            storage.delete(name)
+            if row is not None:
+                row.delete()
+        prefix = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix} файлов: {removed}, {freed / 1024 / 1024:.1f} МиБ'))
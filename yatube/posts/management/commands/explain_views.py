@@ -0,0 +1,138 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from posts.models import Comment, Follow, Group, Post, TimelineEntry, User
+from posts.timeline import TIMELINE_ORDERING
+from posts.utils import (COMMENT_ORDERING, COMMENTS_PER_PAGE, POST_PER_PAGE,
+                         CursorPaginator)
+
+SAMPLE_ID = 1
+SAMPLE_SLUG = 'slug'
+SAMPLE_USERNAME = 'username'
+
+
+def page_queries(title, queryset, ordering, per_page=POST_PER_PAGE):
+    """Первая страница и страница после курсора."""
+    paginator = CursorPaginator(queryset, per_page, ordering)
+    values = [timezone.now(), SAMPLE_ID]
+    return (
+        (f'{title}: первая страница', paginator.page_queryset()),
+        (f'{title}: страница по курсору', paginator.page_queryset(values)),
+    )
+
+
+def view_queries():
+    """Основные запросы каждой view из posts.views."""
+    user = User(id=SAMPLE_ID)
+    post = Post(id=SAMPLE_ID)
+    _, index_cursor_page = page_queries(
+        'index', Post.objects.for_listing(), ('-pub_date', '-id'))
+    return [
+        index_cursor_page,
+        ('group_posts: группа', Group.objects.filter(slug=SAMPLE_SLUG)),
+        *page_queries('group_posts',
+                      Post.objects.for_listing().filter(group_id=SAMPLE_ID),
+                      ('-pub_date', '-id')),
+        ('profile: автор', User.objects.select_related('counters').filter(
+            username=SAMPLE_USERNAME)),
+        ('profile: подписка', Follow.objects.filter(
+            user_id=SAMPLE_ID, author_id=SAMPLE_ID)),
+        *page_queries('profile', user.posts.for_listing(),
+                      ('-pub_date', '-id')),
+        ('post_detail: пост', Post.objects.filter(pk=SAMPLE_ID)),
+        ('post_detail: автор', User.objects.select_related(
+            'counters').filter(pk=SAMPLE_ID)),
+        *page_queries('post_detail: комментарии',
+                      post.comments.select_related('author'),
+                      COMMENT_ORDERING, COMMENTS_PER_PAGE),
+        *page_queries('follow_index: лента', user.timeline.all(),
+                      TIMELINE_ORDERING),
+        ('follow_index: посты страницы',
+         Post.objects.for_listing().order_by().filter(
+             id__in=list(range(POST_PER_PAGE)))),
+        ('follow_index: авторы читателя', Follow.objects.filter(
+            user_id=SAMPLE_ID).values_list('author_id')),
+        ('fan-out: подписчики автора', Follow.objects.filter(
+            author_id=SAMPLE_ID).values_list('user_id')),
+        ('unfollow: записи ленты', TimelineEntry.objects.filter(
+            user_id=SAMPLE_ID, post__author_id=SAMPLE_ID)),
+        ('add_comment: комментарии поста', Comment.objects.filter(
+            post_id=SAMPLE_ID)),
+    ]
+
+
+def known_scans():
+    """Запросы, где просмотр индекса ожидаем: первая страница всей ленты
+    читает индекс по порядку и останавливается на LIMIT."""
+    index_first_page, _ = page_queries(
+        'index', Post.objects.for_listing(), ('-pub_date', '-id'))
+    return [index_first_page]
+
+
+def known_sorts():
+    """Запросы, где временная сортировка ожидаема: JOIN по подпискам
+    сливает посты многих авторов и нужен только как запасной путь
+    ленты FOLLOW_FEED = 'merge'."""
+    return page_queries(
+        'follow_index: JOIN по подпискам (запасной путь)',
+        Post.objects.for_listing().filter(
+            author__following__user_id=SAMPLE_ID),
+        ('-pub_date', '-id'))
+
+
+def plan_problems(plan):
+    """Просмотры таблиц и индексов (SCAN, в том числе USING INDEX)
+    и сортировки во временном B-дереве. Допустим только просмотр
+    покрывающего индекса под узлом SEARCH.
+
+    Строка плана SQLite: ``id parent notused detail``."""
+    details = {}
+    problems = []
+    for line in plan.splitlines():
+        parts = line.strip().split(' ', 3)
+        if len(parts) == 4:
+            node, parent, _, detail = parts
+        else:
+            node = parent = None
+            detail = line.strip()
+        details[node] = detail
+        if 'USE TEMP B-TREE' in detail:
+            problems.append(detail)
+        elif detail.startswith('SCAN ') and not (
+                'COVERING INDEX' in detail
+                and details.get(parent, '').startswith('SEARCH ')):
+            problems.append(detail)
+    return problems
+
+
+class Command(BaseCommand):
+    help = ('Печатает EXPLAIN QUERY PLAN основных запросов каждой view '
+            'и отмечает полные просмотры таблиц и временные сортировки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Завершиться с ошибкой, если есть проблемы.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда рассчитана на SQLite.')
+        problems = 0
+        for title, queryset in view_queries():
+            plan = queryset.explain()
+            found = plan_problems(plan)
+            problems += len(found)
+            style = self.style.ERROR if found else self.style.SUCCESS
+            self.stdout.write(style(f'== {title}'))
+            self.stdout.write(plan)
+        for title, queryset in (*known_scans(), *known_sorts()):
+            self.stdout.write(self.style.WARNING(f'== {title}'))
+            self.stdout.write(queryset.explain())
+        if problems:
+            message = f'Найдено проблем в планах: {problems}'
+            if options['check']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                'Полных просмотров и временных сортировок нет'))
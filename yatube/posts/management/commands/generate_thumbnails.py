@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Создаёт недостающие варианты миниатюр постов с картинками, '
+            'например после добавления ширины или формата. Посты '
+            'обрабатываются пачками, картинки кодируются параллельно '
+            'в пуле процессов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=100,
+                            help='Сколько постов читать из базы за раз.')
+        parser.add_argument(
+            '--workers', type=int,
+            default=max(settings.THUMBNAIL_PROCESSES, 1),
+            help='Сколько картинок обрабатывать одновременно.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['batch'] < 1:
+            raise CommandError('Нужны хотя бы один поток и один пост.')
+        started = perf_counter()
+        posts = Post.objects.exclude(image='').order_by('id')
+        total = created = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            last_id = 0
+            while True:
+                batch = list(posts.filter(id__gt=last_id)[:options['batch']])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+                total += len(batch)
+                created += sum(pool.map(self.generate, batch))
+                self.stdout.write(f'Обработано постов: {total}')
+        elapsed = perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано вариантов: {created} для {total} постов '
+            f'за {elapsed:.2f} с'))
+
+    @staticmethod
+    def generate(post):
+        try:
+            return thumbnails.generate(post)
+        finally:
+            connections.close_all()
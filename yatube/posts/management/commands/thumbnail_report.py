@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+
+from posts import thumbnails
+from posts.models import Post
+from posts.utils import POST_PER_PAGE, CursorPaginator
+
+
+def chosen_variant(found, width):
+    """Вариант, который выберет браузер: самый узкий не уже ``width``
+    в первом доступном дополнительном формате или в основном."""
+    for format_ in (*settings.POST_THUMBNAIL_FORMATS, None):
+        ready = [(variant, image) for variant, image in found
+                 if image and variant.format == format_]
+        if ready:
+            wide_enough = [pair for pair in ready if pair[0].width >= width]
+            return (wide_enough or ready[-1:])[0][1]
+    return None
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает объём картинок первых страниц главной: одна '
+            'миниатюра на всех против вариантов, которые выберет браузер '
+            'с заданной шириной экрана.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=3,
+                            help='Сколько страниц главной посчитать.')
+        parser.add_argument('--viewport', type=int, default=390,
+                            help='Ширина экрана в CSS-пикселях.')
+        parser.add_argument('--dpr', type=float, default=2,
+                            help='Плотность пикселей экрана.')
+        parser.add_argument('--name', default='card',
+                            help='Миниатюра из POST_THUMBNAILS.')
+
+    def handle(self, *args, **options):
+        name = options['name']
+        geometry, _ = settings.POST_THUMBNAILS[name]
+        width = min(int(options['viewport'] * options['dpr']),
+                    int(geometry.partition('x')[0]))
+        paginator = CursorPaginator(Post.objects.for_listing(), POST_PER_PAGE)
+        page = paginator.first_page()
+        before_total = after_total = 0
+        for number in range(1, options['pages'] + 1):
+            before = after = pending = 0
+            for post in page:
+                if not post.image:
+                    continue
+                found = thumbnails.lookup(post.image, name)
+                main = thumbnails.get_existing(post.image, name)
+                if main is None:
+                    pending += 1
+                    continue
+                before += default.storage.size(main.name)
+                after += default.storage.size(
+                    chosen_variant(found, width).name)
+            before_total += before
+            after_total += after
+            line = (f'Страница {number}: {self.kib(before)} → '
+                    f'{self.kib(after)}, {self.saved(before, after)}')
+            if pending:
+                line += f', без миниатюр: {pending}'
+            self.stdout.write(line)
+            if not page.has_next():
+                break
+            page = paginator.get_page(page.next_cursor)
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего при ширине {width}px: {self.kib(before_total)} → '
+            f'{self.kib(after_total)}, '
+            f'{self.saved(before_total, after_total)}'))
+
+    @staticmethod
+    def kib(size):
+        return f'{size / 1024:.1f} КиБ'
+
+    @staticmethod
+    def saved(before, after):
+        if not before:
+            return 'экономия 0%'
+        return f'экономия {(before - after) / before:.0%}'
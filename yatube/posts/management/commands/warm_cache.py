@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import perf_counter
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from posts.models import Group, Post, User
+from posts.utils import POST_PER_PAGE, CursorPaginator
+
+
+def page_urls(url, queryset, pages):
+    """Адреса первых страниц ленты в том виде, в каком их строит
+    шаблон пагинатора: первая без параметров, дальше по курсору."""
+    paginator = CursorPaginator(queryset, POST_PER_PAGE)
+    page = paginator.first_page()
+    urls = [url]
+    while len(urls) < pages and page.has_next():
+        urls.append(f'{url}?cursor={page.next_cursor}')
+        page = paginator.get_page(page.next_cursor)
+    return urls
+
+
+class Command(BaseCommand):
+    help = ('Прогревает кэши перед вводом узла в балансировщик: рендерит '
+            'первые страницы главной, самых наполненных групп и самых '
+            'активных авторов в несколько потоков.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=3,
+                            help='Сколько страниц каждой ленты рендерить.')
+        parser.add_argument('--groups', type=int, default=10,
+                            help='Сколько групп с наибольшим числом постов.')
+        parser.add_argument('--profiles', type=int, default=20,
+                            help='Сколько авторов с наибольшим числом постов.')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Сколько потоков рендерят страницы.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('Нужен хотя бы один поток.')
+        started = perf_counter()
+        urls = self.collect_urls(options)
+        self.stdout.write(f'Страниц для прогрева: {len(urls)}')
+        results = []
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = [pool.submit(self.render, url) for url in urls]
+            for future in as_completed(futures):
+                results.append(future.result())
+        failed = [(url, status) for url, status, _ in results
+                  if status != 200]
+        for url, status in failed:
+            self.stdout.write(self.style.ERROR(f'{status} {url}'))
+        if results:
+            url, _, slowest = max(results, key=lambda result: result[2])
+            self.stdout.write(
+                f'Самая медленная: {url} — {slowest * 1000:.0f} мс')
+        elapsed = perf_counter() - started
+        style = self.style.ERROR if failed else self.style.SUCCESS
+        self.stdout.write(style(
+            f'Прогрето страниц: {len(results) - len(failed)} '
+            f'из {len(results)} за {elapsed:.2f} с'))
+        if failed:
+            raise CommandError(f'Не удалось отрендерить: {len(failed)}')
+
+    def collect_urls(self, options):
+        pages = options['pages']
+        urls = page_urls(reverse('posts:posts'),
+                         Post.objects.for_listing(), pages)
+        groups = Group.objects.annotate(
+            posts_total=Count('posts')).order_by('-posts_total', 'id')
+        for group in groups[:options['groups']]:
+            urls += page_urls(
+                reverse('posts:group_list', args=[group.slug]),
+                group.posts.for_listing(), pages)
+        authors = User.objects.filter(counters__posts_count__gt=0).order_by(
+            '-counters__posts_count', 'id')
+        for author in authors[:options['profiles']]:
+            urls += page_urls(
+                reverse('posts:profile', args=[author.username]),
+                author.posts.for_listing(), pages)
+        return urls
+
+    @staticmethod
+    def render(url):
+        """Вызывает представление как для анонимного посетителя:
+        заполняет кэши фрагментов, поколений и объектов и ставит
+        в очередь недостающие миниатюры."""
+        try:
+            started = perf_counter()
+            request = RequestFactory().get(url)
+            request.user = AnonymousUser()
+            match = resolve(request.path_info)
+            response = match.func(request, *match.args, **match.kwargs)
+            return url, response.status_code, perf_counter() - started
+        finally:
+            connections.close_all()
@@ -0,0 +1,61 @@
+# Generated by Django 2.2.16 on 2026-10-18 08:46
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def count_by(model, field):
+    """Коррелированный подзапрос: сколько строк ``model`` ссылаются
+    на пользователя полем ``field``."""
+    rows = model.objects.filter(**{field: models.OuterRef('user_id')})
+    total = rows.order_by().values(field).annotate(
+        total=models.Count('pk')).values('total')
+    return Coalesce(models.Subquery(total), 0)
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('posts', 'Follow')
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    # Каждый счётчик считается своим подзапросом: JOIN постов
+    # и подписок в одном запросе перемножил бы строки.
+    UserCounters.objects.bulk_create(
+        (UserCounters(user_id=user_id) for user_id
+         in User.objects.values_list('pk', flat=True).iterator()),
+        batch_size=500)
+    UserCounters.objects.update(
+        posts_count=count_by(Post, 'author'),
+        followers_count=count_by(Follow, 'author'),
+        following_count=count_by(Follow, 'user'))
+    comments = Post.objects.filter(pk=models.OuterRef('pk')).annotate(
+        total=models.Count('comments')).values('total')
+    Post.objects.update(comments_count=models.Subquery(comments))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0012_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
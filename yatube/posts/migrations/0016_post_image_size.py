@@ -0,0 +1,68 @@
+# Generated by Django 2.2.16 on 2026-10-18 10:41
+
+from django.core.files.images import get_image_dimensions
+from django.db import migrations, models, transaction
+import posts.models
+from posts.images import tiny_placeholder
+
+CHUNK_SIZE = 200
+
+
+def fill_image_size(apps, schema_editor):
+    """Размеры и заглушки старых картинок; каждая пачка постов
+    сохраняется своей транзакцией, чтобы не держать блокировку."""
+    Post = apps.get_model('posts', 'Post')
+    posts = Post.objects.exclude(image='').filter(
+        image_width__isnull=True).order_by('id')
+    last_id = 0
+    while True:
+        chunk = list(posts.filter(id__gt=last_id)[:CHUNK_SIZE])
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        for post in chunk:
+            try:
+                post.image.open('rb')
+            except OSError:
+                continue
+            try:
+                post.image_width, post.image_height = get_image_dimensions(
+                    post.image)
+                post.image_placeholder = tiny_placeholder(post.image)
+            finally:
+                post.image.close()
+        with transaction.atomic():
+            Post.objects.bulk_update(
+                chunk, ['image_width', 'image_height', 'image_placeholder'])
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('posts', '0015_post_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_placeholder',
+            field=models.TextField(blank=True, editable=False, help_text='data: URI размытой копии на время загрузки картинки', verbose_name='Заглушка картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина картинки'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=posts.models.StoredSizeImageField(blank=True, height_field='image_height', help_text='Загрузите изображение', upload_to='posts/', verbose_name='Картинка', width_field='image_width'),
+        ),
+        migrations.RunPython(fill_image_size, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.16 on 2026-10-18 11:05
+
+from django.db import migrations, models
+from django.db.models import Count
+import posts.models
+import posts.storage
+
+
+def count_references(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    MediaFile = apps.get_model('posts', 'MediaFile')
+    references = Post.objects.exclude(image='').values_list(
+        'image').annotate(total=Count('id')).order_by()
+    MediaFile.objects.bulk_create(
+        [MediaFile(name=name, references=total)
+         for name, total in references.iterator()],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_post_image_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Имя файла')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+                ('released', models.DateTimeField(blank=True, null=True, verbose_name='Без ссылок с')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=posts.models.StoredSizeImageField(blank=True, height_field='image_height', help_text='Загрузите изображение', storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка', width_field='image_width'),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
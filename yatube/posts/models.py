@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from core.models import CreatedModel
+from .storage import content_storage
 
 User = get_user_model()
 
@@ -14,6 +15,36 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    LISTING_FIELDS = (
+        'text', 'pub_date', 'modified', 'image', 'image_width',
+        'image_height', 'image_placeholder', 'author', 'group',
+        'author__username', 'author__first_name', 'author__last_name',
+        'group__slug',
+    )
+
+    def for_listing(self):
+        """Посты для лент: автор и группа одним JOIN, только поля,
+        которые выводит карточка поста."""
+        return self.select_related('author', 'group').only(
+            *self.LISTING_FIELDS)
+
+
+class StoredSizeImageField(models.ImageField):
+    """``ImageField``, который вычисляет размеры только у новых файлов.
+
+    Стандартное поле, создавая экземпляр из базы с пустыми размерами,
+    открывает файл в хранилище: лента читала бы диск, а потерянная
+    картинка роняла бы её целиком.
+    """
+
+    def update_dimension_fields(self, instance, force=False, *args,
+                                **kwargs):
+        if not force and isinstance(instance.__dict__.get(self.attname), str):
+            return
+        super().update_dimension_fields(instance, force, *args, **kwargs)
+
+
 class Post(models.Model):
     text = models.TextField(
         'Текст поста',
@@ -22,6 +53,9 @@ class Post(models.Model):
     pub_date = models.DateTimeField(
         'Дата публикации',
         auto_now_add=True)
+    modified = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -38,18 +72,73 @@ class Post(models.Model):
         verbose_name='Группа',
         help_text='Группа, к которой будет относиться пост'
     )
-    image = models.ImageField(
+    image = StoredSizeImageField(
         'Картинка',
         upload_to='posts/',
+        storage=content_storage,
         blank=True,
+        width_field='image_width',
+        height_field='image_height',
         help_text='Загрузите изображение'
     )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        blank=True,
+        null=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        blank=True,
+        null=True,
+        editable=False
+    )
+    image_placeholder = models.TextField(
+        'Заглушка картинки',
+        blank=True,
+        editable=False,
+        help_text='data: URI размытой копии на время загрузки картинки'
+    )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
+
+    # Счётчики меняют только выражения F() в posts.counters, поэтому
+    # сохранение прочитанного раньше поста их не перезаписывает.
+    COUNTER_FIELDS = ('comments_count',)
 
     def __str__(self) -> str:
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS]
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
 
 
 class Comment(CreatedModel):
@@ -73,6 +162,14 @@ class Comment(CreatedModel):
     def __str__(self) -> str:
         return (self.text[:15])
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx'
+            )
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -98,3 +195,84 @@ class Follow(models.Model):
                 name='unique_user_author'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx'
+            )
+        ]
+
+
+class UserCounters(models.Model):
+    """Счётчики пользователя, которые иначе считались бы COUNT(*).
+
+    Обновляются выражениями F() при создании и удалении постов
+    и подписок; расхождения чинит команда reconcile_counters.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    def __str__(self) -> str:
+        return (f'{self.user_id}: {self.posts_count}, '
+                f'{self.followers_count}, {self.following_count}')
+
+
+class MediaFile(models.Model):
+    """Файл картинки в хранилище по содержимому и число постов,
+    которые на него ссылаются.
+
+    Счётчик меняют сигналы постов; когда он обнуляется, ``released``
+    отмечает время, после которого файл может удалить collect_media.
+    """
+    name = models.CharField('Имя файла', max_length=100, unique=True)
+    references = models.PositiveIntegerField('Ссылок', default=0)
+    released = models.DateTimeField('Без ссылок с', blank=True, null=True)
+
+    def __str__(self) -> str:
+        return f'{self.name}: {self.references}'
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя.
+
+    Заполняется при публикации поста (fan-out on write) и при подписке,
+    поэтому страница ленты читается одним диапазоном по индексу.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    pub_date = models.DateTimeField('Дата публикации поста')
+
+    def __str__(self) -> str:
+        return (f'{self.user}, {self.post_id}')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_user_post'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx'
+            )
+        ]
@@ -0,0 +1,149 @@
+"""Кэш объектов для поиска по slug, username и первичному ключу.
+
+Экземпляр лежит в кэше под своим первичным ключом, а slug группы
+и username пользователя ведут к первичному ключу. Отсутствующие ключи
+запоминаются ненадолго, чтобы повторные запросы несуществующих адресов
+не доходили до базы, а первые такие запросы отсекает фильтр
+из ``posts.existence``. Записи сбрасывают сигналы моделей и изменения
+счётчиков; размер ограничен LRU первого уровня кэша.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+
+from .existence import might_exist
+from .models import Group, Post, User
+
+OBJECT_KEY = 'object:{}:{}:{}'
+MISSING = 'missing'
+
+# Поля, по которым объект ищут кроме первичного ключа.
+ALIASES = {
+    Group: ('slug',),
+    User: ('username',),
+    Post: (),
+}
+# Связи, которые кэшируются вместе с объектом.
+RELATED = {
+    User: ('counters',),
+}
+# Поля, которые попадают в кэш; остальные отложены и при обращении
+# читаются из базы. Пароль, почта и права пользователя в кэш не попадают.
+FIELDS = {
+    User: ('username', 'first_name', 'last_name', 'is_active', 'counters'),
+}
+
+
+def _key(model, field, value):
+    if field != 'pk':
+        # slug и username могут содержать символы, недопустимые в ключе.
+        value = hashlib.md5(str(value).encode()).hexdigest()
+    return OBJECT_KEY.format(model._meta.label_lower, field, value)
+
+
+def _load(model, field, value):
+    if not might_exist(model, field, value):
+        return None
+    queryset = model._default_manager.select_related(
+        *RELATED.get(model, ()))
+    if model in FIELDS:
+        queryset = queryset.only(*FIELDS[model])
+    try:
+        return queryset.get(**{field: value})
+    except model.DoesNotExist:
+        return None
+
+
+def _remember(model, field, value, instance):
+    if instance is None:
+        cache.set(_key(model, field, value), MISSING,
+                  settings.OBJECT_CACHE_MISSING_TIMEOUT)
+        return
+    entries = {_key(model, 'pk', instance.pk): instance}
+    for alias in ALIASES[model]:
+        entries[_key(model, alias, getattr(instance, alias))] = instance.pk
+    cache.set_many(entries, settings.OBJECT_CACHE_TIMEOUT)
+
+
+def _public_copy(instance):
+    """Копия объекта, прочитанного целиком, только с полями из FIELDS."""
+    model = type(instance)
+    names = [field.attname for field in model._meta.concrete_fields
+             if field.primary_key or field.name in FIELDS[model]]
+    copy = model.from_db(instance._state.db, names,
+                         [getattr(instance, name) for name in names])
+    for name in RELATED.get(model, ()):
+        if name in instance._state.fields_cache:
+            copy._state.fields_cache[name] = instance._state.fields_cache[name]
+    return copy
+
+
+def remember(instance):
+    """Кладёт в кэш объект, уже прочитанный из базы."""
+    model = type(instance)
+    if model in FIELDS:
+        instance = _public_copy(instance)
+    _remember(model, 'pk', instance.pk, instance)
+
+
+def _get_by_pk(model, pk):
+    instance = cache.get(_key(model, 'pk', pk))
+    if instance == MISSING:
+        return None
+    if instance is None:
+        instance = _load(model, 'pk', pk)
+        _remember(model, 'pk', pk, instance)
+    return instance
+
+
+def get_cached(model, **lookup):
+    """Объект ``model`` по ``pk`` или полю из ``ALIASES``; None, если
+    такого нет.
+
+        get_cached(Group, slug='cats')
+    """
+    (field, value), = lookup.items()
+    if field == 'id':
+        field = 'pk'
+    if field == 'pk':
+        return _get_by_pk(model, value)
+    if field not in ALIASES[model]:
+        raise ValueError(
+            f'{model._meta.object_name} не кэшируется по полю {field}')
+    pk = cache.get(_key(model, field, value))
+    if pk == MISSING:
+        return None
+    if pk is not None:
+        instance = _get_by_pk(model, pk)
+        # Псевдоним мог остаться от старого slug или username.
+        if instance is not None and getattr(instance, field) == value:
+            return instance
+    instance = _load(model, field, value)
+    _remember(model, field, value, instance)
+    return instance
+
+
+def get_object_or_404(model, **lookup):
+    """Как ``django.shortcuts.get_object_or_404``, но через кэш."""
+    instance = get_cached(model, **lookup)
+    if instance is None:
+        raise Http404(
+            f'No {model._meta.object_name} matches the given query.')
+    return instance
+
+
+def forget(instance):
+    """Сбрасывает объект и его псевдонимы, в том числе запомненное
+    отсутствие только что созданного объекта."""
+    model = type(instance)
+    cache.delete_many(
+        [_key(model, 'pk', instance.pk)]
+        + [_key(model, alias, getattr(instance, alias))
+           for alias in ALIASES[model]])
+
+
+def forget_pk(model, *pks):
+    """Сбрасывает объекты, изменённые в обход ``save()``."""
+    cache.delete_many([_key(model, 'pk', pk) for pk in pks])
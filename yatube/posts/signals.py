@@ -0,0 +1,148 @@
+from django.conf import settings
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from users.backends import forget_session_hash
+
+from . import counters, existence, generations, thumbnails, timeline
+from .images import tiny_placeholder
+from .models import Comment, Follow, Group, Post, User
+from .object_cache import forget
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    instance._previous_group_id = instance._previous_image = None
+    if instance.pk and not raw:
+        previous = Post.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'image').first()
+        if previous is not None:
+            (instance._previous_group_id,
+             instance._previous_image) = previous
+    if raw:
+        return
+    if not instance.image:
+        instance.image_placeholder = ''
+    elif not instance.image._committed:
+        # Новый файл ещё в памяти: читать его дешевле, чем из хранилища.
+        instance.image_placeholder = tiny_placeholder(instance.image)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    forget(instance)
+    generations.post_changed(instance, instance._previous_group_id)
+    if (instance.image.name or '') != (instance._previous_image or ''):
+        if instance.image:
+            counters.bump_media(instance.image.name, 1)
+            thumbnails.schedule(instance)
+        if instance._previous_image:
+            counters.bump_media(instance._previous_image, -1)
+    if created:
+        existence.record(Post, 'pk', instance.pk)
+        counters.bump_user(instance.author_id, posts_count=1)
+        if settings.FOLLOW_FEED == 'timeline':
+            timeline.fan_out.enqueue(post_id=instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    forget(instance)
+    generations.post_changed(instance)
+    counters.bump_user(instance.author_id, posts_count=-1)
+    if instance.image:
+        counters.bump_media(instance.image.name, -1)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        forget(instance)
+        generations.group_changed(instance)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        existence.record(Group, 'slug', instance.slug)
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Вход сохраняет только last_login: карточку он не трогает.
+    instance._previous_card = None
+    if raw or not instance.pk or (
+            update_fields is not None
+            and not generations.USER_CARD_FIELDS & set(update_fields)):
+        return
+    instance._previous_card = User.objects.filter(pk=instance.pk).values(
+        *generations.USER_CARD_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, update_fields=None,
+               **kwargs):
+    if not raw:
+        forget(instance)
+        forget_session_hash(instance.pk)
+        if not created:
+            generations.user_changed(instance, instance._previous_card)
+        if update_fields is None or 'username' in update_fields:
+            existence.record(User, 'username', instance.username)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # Каскад удаляет посты и подписки раньше самого пользователя.
+    counters.user_deleting(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    counters.user_deleted(instance.pk)
+    forget(instance)
+    forget_session_hash(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_comments(instance.post_id, 1)
+        generations.comments_changed(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+    generations.comments_changed(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    counters.bump_user(instance.user_id, following_count=1)
+    counters.bump_user(instance.author_id, followers_count=1)
+    generations.follow_changed(instance)
+    if settings.FOLLOW_FEED == 'timeline':
+        timeline.add_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.user_id, following_count=-1)
+    counters.bump_user(instance.author_id, followers_count=-1)
+    generations.follow_changed(instance)
+    if settings.FOLLOW_FEED == 'timeline':
+        timeline.remove_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_migrate)
+def migrated(sender, **kwargs):
+    # Фильтр процесса мог запомнить строки, которых после flush нет.
+    if sender.name == 'posts':
+        existence.reset()
@@ -0,0 +1,48 @@
+"""Хранилище картинок постов с адресацией по содержимому.
+
+Файл называется SHA-256 своего содержимого: ``posts/ab/abcdef….jpg``.
+Одинаковые картинки, загруженные в разные посты, занимают на диске
+один файл, а миниатюры sorl, которые зависят от имени исходника,
+создаются для них тоже один раз. Сколько постов ссылается на файл,
+считает ``MediaFile``; файлы без ссылок удаляет команда collect_media.
+"""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def content_name(self, name, content):
+        """Имя файла по его содержимому в каталоге исходного имени."""
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        hexdigest = digest.hexdigest()
+        return os.path.join(directory, hexdigest[:2],
+                            hexdigest + extension).replace('\\', '/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # Свежее время изменения защищает файл от сборщика мусора,
+            # пока пост, который на него сошлётся, ещё не сохранён.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+
+content_storage = ContentAddressedStorage()
@@ -0,0 +1,37 @@
+from django import template
+from django.conf import settings
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post, name):
+    """Готовые варианты миниатюры поста или заглушка её размера:
+
+        {% post_thumbnail post "card" as im %}
+        {% if im.url %}<img src="{{ im.url }}" srcset="{{ im.srcset }}">
+        {% endif %}
+    """
+    if not post.image:
+        return None
+    found = thumbnails.find(post, name)
+    if not all(image for _, image in found):
+        thumbnails.schedule(post)
+    image = thumbnails.responsive(found)
+    if image is not None:
+        return image
+    geometry, _ = settings.POST_THUMBNAILS[name]
+    return thumbnails.Placeholder(geometry)
+
+
+@register.simple_tag
+def prefetch_thumbnails(posts, name):
+    """Готовит чтение миниатюр всех постов страницы одним запросом:
+
+        {% prefetch_thumbnails page_obj "card" %}
+        {% for post in page_obj %}...{% endfor %}
+    """
+    thumbnails.prefetch(posts, name)
+    return ''
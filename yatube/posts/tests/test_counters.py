@@ -0,0 +1,128 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..counters import bump_user
+from ..models import Comment, Follow, Post, User, UserCounters
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def test_counters_follow_posts_comments_and_follows(self):
+        """Счётчики меняются при создании и удалении записей."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Post.objects.create(author=self.author, text='Второй')
+        comment = Comment.objects.create(post=post, author=self.reader,
+                                         text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.author.counters.posts_count, 2)
+        self.assertEqual(self.author.counters.followers_count, 1)
+        self.assertEqual(self.reader.counters.following_count, 1)
+
+        comment.delete()
+        follow.delete()
+        Post.objects.filter(text='Второй').delete()
+        post.refresh_from_db()
+        counters = UserCounters.objects.get(user=self.author)
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(counters.posts_count, 1)
+        self.assertEqual(counters.followers_count, 0)
+
+    def test_stale_post_save_keeps_comment_count(self):
+        """Правка поста не затирает комментарии, добавленные, пока
+        форма была открыта."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader,
+                               text='Комментарий')
+        post.text = 'Исправленный пост'
+        post.save()
+        self.client.force_login(self.author)
+        self.client.post(reverse('posts:post_edit', args=[post.pk]),
+                         {'text': 'Ещё раз исправленный'})
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Ещё раз исправленный')
+        self.assertEqual(post.comments_count, 1)
+
+    def test_reconcile_counters_repairs_drift(self):
+        """reconcile_counters исправляет разошедшиеся счётчики."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        UserCounters.objects.filter(user=self.author).update(posts_count=9)
+        Post.objects.filter(pk=post.pk).update(comments_count=5)
+        call_command('reconcile_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(
+            UserCounters.objects.get(user=self.author).posts_count, 1)
+
+    def test_profile_and_detail_do_not_count(self):
+        """Профиль и страница поста не выполняют COUNT(*)."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        urls = (
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:post_detail', args=[post.id]),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as captured:
+                    response = self.client.get(url)
+                self.assertEqual(response.context['post_count'], 1)
+                self.assertFalse(any('COUNT(' in query['sql']
+                                     for query in captured))
+
+
+class UserDeletionTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.other = User.objects.create_user(username='other')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+        Post.objects.create(author=self.other, text='Чужой')
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.author, author=self.other)
+
+    def counters(self, user):
+        return UserCounters.objects.get(user=user)
+
+    def test_delete_author_with_posts_and_followers(self):
+        """Автор с постами, подписчиками и подписками удаляется,
+        а счётчики остальных пользователей уменьшаются."""
+        self.author.delete()
+        self.assertFalse(User.objects.filter(username='author').exists())
+        self.assertFalse(UserCounters.objects.filter(
+            user_id=self.author.pk).exists())
+        self.assertEqual(self.counters(self.reader).following_count, 0)
+        self.assertEqual(self.counters(self.other).followers_count, 0)
+        self.assertEqual(self.counters(self.other).posts_count, 1)
+
+    def test_delete_follower_with_comments(self):
+        """Подписчик с комментариями удаляется, счётчики автора
+        и поста уменьшаются."""
+        self.reader.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+        self.assertEqual(self.counters(self.author).followers_count, 0)
+        self.assertEqual(self.counters(self.author).posts_count, 1)
+
+    def test_decrement_never_goes_below_zero(self):
+        """Уменьшение счётчика, который уже разошёлся, останавливается
+        на нуле и не создаёт строку."""
+        UserCounters.objects.filter(user=self.other).update(
+            followers_count=0)
+        Follow.objects.filter(author=self.other).delete()
+        self.assertEqual(self.counters(self.other).followers_count, 0)
+        nobody = User.objects.create_user(username='nobody')
+        bump_user(nobody.pk, posts_count=-1)
+        self.assertFalse(UserCounters.objects.filter(user=nobody).exists())
@@ -0,0 +1,99 @@
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from .. import existence
+from ..existence import EXISTS_COUNTER, BloomFilter, might_exist
+from ..models import Group, Post, User
+
+
+class BloomFilterTests(TestCase):
+    def test_no_false_negatives(self):
+        """Добавленные значения всегда находятся, чужие — редко."""
+        bloom = BloomFilter(1000)
+        for number in range(1000):
+            bloom.add(f'user{number}')
+        self.assertTrue(all(f'user{number}' in bloom
+                            for number in range(1000)))
+        false_positives = sum(f'other{number}' in bloom
+                              for number in range(1000))
+        self.assertLess(false_positives, 50)
+
+
+class ExistenceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        existence.build()
+
+    def test_missing_objects_are_answered_without_queries(self):
+        """Несуществующие профиль, группа и пост — 404 без запросов."""
+        urls = (
+            reverse('posts:profile', args=['nobody']),
+            reverse('posts:group_list', args=['nothing']),
+            reverse('posts:post_detail', args=[self.post.pk + 1000]),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                with self.assertNumQueries(0):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 404)
+
+    def test_created_objects_are_found(self):
+        """Созданные после построения фильтра объекты находятся."""
+        user = User.objects.create_user(username='newbie')
+        group = Group.objects.create(
+            title='Новая', slug='new', description='Описание')
+        post = Post.objects.create(author=user, group=group, text='Новый')
+        urls = (
+            reverse('posts:profile', args=[user.username]),
+            reverse('posts:group_list', args=[group.slug]),
+            reverse('posts:post_detail', args=[post.pk]),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_other_process_additions_are_read_from_journal(self):
+        """Запись журнала от другого процесса попадает в фильтр."""
+        index = existence.INDEXES[User, 'username']
+        index._journal('author')
+        self.assertFalse(might_exist(User, 'username', 'remote'))
+        index._journal('remote')
+        with self.assertNumQueries(0):
+            self.assertTrue(might_exist(User, 'username', 'remote'))
+
+    def test_lost_journal_entry_rebuilds_filter(self):
+        """Пропавшая запись журнала заставляет перестроить фильтр."""
+        existence.INDEXES[User, 'username']._journal('author')
+        self.assertFalse(might_exist(User, 'username', 'remote'))
+        User.objects.bulk_create([User(username='remote')])
+        cache.incr(EXISTS_COUNTER.format('usernames'))
+        self.assertTrue(might_exist(User, 'username', 'remote'))
+
+
+class BackgroundRebuildTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        existence.reset()
+        User.objects.create_user(username='author')
+
+    def tearDown(self):
+        existence.reset()
+
+    def test_expired_filter_is_rebuilt_in_background(self):
+        """Устаревший фильтр отвечает, пока новый строится в потоке."""
+        index = existence.INDEXES[User, 'username']
+        self.assertFalse(might_exist(User, 'username', 'bulk'))
+        User.objects.bulk_create([User(username='bulk')])
+        with self.settings(EXISTENCE_REBUILD_INTERVAL=0):
+            with self.assertNumQueries(0):
+                self.assertFalse(might_exist(User, 'username', 'bulk'))
+        index.rebuilding.join()
+        self.assertTrue(might_exist(User, 'username', 'bulk'))
@@ -1,3 +1,4 @@
+import hashlib
 import tempfile
 import shutil
 
@@ -36,6 +37,9 @@ class PostFormTests(TestCase):
             b'\x02\x00\x01\x00\x00\x02\x02\x0C'
             b'\x0A\x00\x3B'
         )
+        # Картинки хранятся под хэшем содержимого.
+        digest = hashlib.sha256(self.small_gif).hexdigest()
+        self.stored_name = f'posts/{digest[:2]}/{digest}.gif'
         self.user = PostFormTests.user
         self.author = self.user
         self.guest_client = Client()
@@ -62,7 +66,7 @@ class PostFormTests(TestCase):
         self.assertEqual(
             Post.objects.count(), post_count + 1, 'Запись в базе не создана')
         self.assertEqual(
-            Post.objects.last().image.name, 'posts/test_small.gif')
+            Post.objects.last().image.name, self.stored_name)
 
     def test_form_edit_post(self):
         """Тест изменений записи в бд при редактировании поста"""
@@ -90,7 +94,7 @@ class PostFormTests(TestCase):
         self.assertEqual(
             Post.objects.count(), post_count + 1, 'Запись в базе не создана')
         self.assertEqual(
-            Post.objects.last().image.name, 'posts/test_edit.gif')
+            Post.objects.last().image.name, self.stored_name)
 
     def test_add_comment_and_save_to_database(self):
         """Добавление комментария и сохранение в БД"""
@@ -0,0 +1,109 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from .. import images
+from ..models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def uploaded_image(size=(64, 32), format_='PNG', mode='RGB'):
+    buffer = BytesIO()
+    Image.new(mode, size).save(buffer, format_)
+    return SimpleUploadedFile(f'image.{format_.lower()}', buffer.getvalue(),
+                              content_type=f'image/{format_.lower()}')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_INGEST_PROCESSES=0)
+class ImageIngestTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def create(self, image):
+        return self.client.post(reverse('posts:post_create'),
+                                {'text': 'Пост', 'image': image})
+
+    def assertRejected(self, response, message):
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(message, ' '.join(response.context['form'].errors[
+            'image']))
+        self.assertFalse(Post.objects.exists())
+
+    def test_small_image_is_stored_as_is(self):
+        """Картинка в пределах лимитов сохраняется без изменений."""
+        image = uploaded_image()
+        content = image.read()
+        image.seek(0)
+        self.create(image)
+        post = Post.objects.get()
+        self.assertEqual((post.image_width, post.image_height), (64, 32))
+        self.assertEqual(post.image.read(), content)
+
+    @override_settings(POST_IMAGE_MAX_SIDE=32)
+    def test_large_image_is_downscaled(self):
+        """Картинка больше допустимой стороны уменьшается при загрузке."""
+        self.create(uploaded_image((64, 32), 'JPEG'))
+        post = Post.objects.get()
+        self.assertEqual((post.image_width, post.image_height), (32, 16))
+        with Image.open(post.image) as stored:
+            self.assertEqual((stored.format, stored.size), ('JPEG', (32, 16)))
+
+    @override_settings(POST_IMAGE_MAX_BYTES=50)
+    def test_oversized_file_is_rejected(self):
+        """Файл больше лимита отклоняется."""
+        self.assertRejected(self.create(uploaded_image()), 'Файл больше')
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1000)
+    def test_too_many_pixels_are_rejected(self):
+        """Картинка с числом пикселей больше лимита отклоняется."""
+        self.assertRejected(self.create(uploaded_image()),
+                            'слишком большая')
+
+    def test_decompression_bomb_is_rejected(self):
+        """Маленький файл с огромным изображением отклоняется по
+        заголовку, не распаковываясь."""
+        bomb = uploaded_image((20000, 20000), mode='1')
+        self.assertLess(bomb.size, settings.POST_IMAGE_MAX_BYTES)
+        self.assertRejected(self.create(bomb), images.BOMB)
+
+    def test_broken_image_is_rejected(self):
+        """Файл, который не декодируется, отклоняется."""
+        broken = SimpleUploadedFile('broken.png', b'\x89PNG\r\n\x1a\nbroken',
+                                    content_type='image/png')
+        self.assertRejected(self.create(broken), 'правильное изображение')
+
+    @override_settings(IMAGE_INGEST_PROCESSES=1)
+    def test_slow_decoding_times_out(self):
+        """Декодирование дольше тайм-аута прерывается, а следующее
+        проходит как обычно."""
+        # Большую картинку процесс декодирует и уменьшает дольше
+        # тайм-аута.
+        with override_settings(IMAGE_INGEST_TIMEOUT=1e-6):
+            self.assertRejected(self.create(uploaded_image((3000, 3000))),
+                                'слишком долго')
+        self.create(uploaded_image())
+        self.assertTrue(Post.objects.exists())
+
+    @override_settings(IMAGE_INGEST_PROCESSES=1)
+    def test_decoding_in_process_pool(self):
+        """Пул процессов принимает и уменьшает картинку так же."""
+        with override_settings(POST_IMAGE_MAX_SIDE=16):
+            self.create(uploaded_image())
+        self.assertEqual(Post.objects.get().image_width, 16)
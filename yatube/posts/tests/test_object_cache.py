@@ -0,0 +1,88 @@
+from django.core.cache import cache
+from django.db import connection
+from django.http import Http404
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Group, Post, User
+from ..object_cache import get_cached, get_object_or_404
+
+
+class ObjectCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_second_lookup_does_not_query(self):
+        """Повторный поиск по slug, username и id не обращается к базе."""
+        lookups = (
+            (Group, {'slug': self.group.slug}, self.group),
+            (User, {'username': self.author.username}, self.author),
+            (Post, {'pk': self.post.pk}, self.post),
+            (Group, {'pk': self.group.pk}, self.group),
+        )
+        for model, lookup, expected in lookups:
+            with self.subTest(lookup=lookup):
+                self.assertEqual(get_cached(model, **lookup), expected)
+                with self.assertNumQueries(0):
+                    self.assertEqual(get_cached(model, **lookup), expected)
+
+    def test_private_user_fields_are_not_cached(self):
+        """Пароль, почта и права пользователя в кэш не попадают."""
+        get_cached(User, pk=self.author.pk)
+        with self.assertNumQueries(0):
+            author = get_cached(User, pk=self.author.pk)
+        self.assertEqual(author.username, 'author')
+        self.assertTrue({'password', 'email', 'is_superuser'}
+                        <= author.get_deferred_fields())
+
+    def test_missing_object_is_remembered(self):
+        """Отсутствие объекта запоминается, пока его не создадут."""
+        with self.assertRaises(Http404):
+            get_object_or_404(Group, slug='new')
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_cached(Group, slug='new'))
+        group = Group.objects.create(
+            title='Новая', slug='new', description='Описание')
+        self.assertEqual(get_object_or_404(Group, slug='new'), group)
+
+    def test_changes_reach_cached_objects(self):
+        """Сохранение, новый slug и счётчики сбрасывают кэш."""
+        group = Group.objects.create(
+            title='Старая', slug='old', description='Описание')
+        get_cached(Group, slug='old')
+        group.slug = 'renamed'
+        group.save()
+        self.assertIsNone(get_cached(Group, slug='old'))
+        self.assertEqual(get_cached(Group, slug='renamed').pk, group.pk)
+
+        self.assertEqual(get_cached(Post, pk=self.post.pk).comments_count, 0)
+        Comment.objects.create(post=self.post, author=self.author,
+                               text='Комментарий')
+        self.assertEqual(get_cached(Post, pk=self.post.pk).comments_count, 1)
+
+        author = get_cached(User, username='author')
+        self.assertEqual(author.counters.posts_count, 1)
+        Post.objects.create(author=self.author, text='Ещё пост')
+        author = get_cached(User, username='author')
+        self.assertEqual(author.counters.posts_count, 2)
+
+    def test_post_detail_reads_post_from_cache(self):
+        """Повторный просмотр поста не читает пост и автора из базы."""
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.context['post'], self.post)
+        self.assertEqual(response.context['post_count'], 1)
+        queries = ' '.join(query['sql'] for query in captured)
+        self.assertNotIn('FROM "posts_post"', queries)
+        self.assertNotIn('FROM "auth_user"', queries)
@@ -0,0 +1,176 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.jobs import run_pending
+
+from .. import existence
+from ..management.commands.explain_views import plan_problems
+from ..models import Comment, Follow, Group, Post, User
+from ..utils import COMMENTS_PER_PAGE, POST_PER_PAGE, CursorPaginator
+
+POSTS_ON_PAGE = 10
+
+
+class ListingQueryBudgetTests(TestCase):
+    """Число запросов на страницах лент не зависит от числа постов."""
+
+    # Запрос авторизованного клиента: пользователь после входа ещё
+    # не в кэше, а сессия уже в кэше.
+    AUTH_QUERIES = 1
+    # Группа и профиль читаются из базы один раз: для ETag и для view
+    # их отдаёт кэш объектов.
+    BUDGETS = {
+        'posts:posts': 1,
+        'posts:group_list': 2,
+        'posts:profile': 3,
+        'posts:follow_index': 2,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.author = User.objects.create_user(
+            username='author', first_name='Имя', last_name='Фамилия')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for number in range(POSTS_ON_PAGE):
+            Post.objects.create(author=cls.author, group=cls.group,
+                                text=f'Пост {number}')
+        run_pending()
+
+    def setUp(self):
+        cache.clear()
+        # Фильтр существующих ключей строится один раз на процесс.
+        existence.build()
+        self.reader_client = self.client_class()
+        self.reader_client.force_login(self.reader)
+
+    def get_urls(self):
+        return {
+            'posts:posts': reverse('posts:posts'),
+            'posts:group_list': reverse('posts:group_list',
+                                        args=[self.group.slug]),
+            'posts:profile': reverse('posts:profile',
+                                     args=[self.author.username]),
+            'posts:follow_index': reverse('posts:follow_index'),
+        }
+
+    def assertQueryBudget(self, client, url, budget):
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(url)
+        self.assertEqual(len(response.context['page_obj']), POSTS_ON_PAGE)
+        queries = '\n'.join(query['sql'] for query in captured)
+        self.assertLessEqual(
+            len(captured), budget,
+            f'{url}: {len(captured)} запросов при бюджете {budget}:\n'
+            f'{queries}')
+
+    def test_listing_pages_fit_query_budget(self):
+        """Страницы лент укладываются в бюджет запросов."""
+        for name, url in self.get_urls().items():
+            with self.subTest(url=url):
+                self.assertQueryBudget(
+                    self.reader_client, url,
+                    self.BUDGETS[name] + self.AUTH_QUERIES)
+
+    def test_view_queries_use_indexes(self):
+        """Основные запросы views не просматривают таблицы целиком
+        и не сортируют во временном B-дереве."""
+        call_command('explain_views', '--check', stdout=StringIO())
+
+    def test_guest_listing_pages_fit_query_budget(self):
+        """Страницы лент для гостя укладываются в бюджет запросов."""
+        for name, url in self.get_urls().items():
+            if name == 'posts:follow_index':
+                continue
+            with self.subTest(url=url):
+                self.assertQueryBudget(self.client, url, self.BUDGETS[name])
+
+
+class CursorSeekPlanTests(TestCase):
+    def test_seek_searches_index_range(self):
+        """Страница по курсору ищет диапазон в индексе, а не просматривает
+        его с начала, в обе стороны."""
+        paginator = CursorPaginator(Post.objects.for_listing(),
+                                    POST_PER_PAGE)
+        for backwards in (False, True):
+            with self.subTest(backwards=backwards):
+                plan = paginator.page_queryset(
+                    [timezone.now(), 1], backwards).explain()
+                posts = [line for line in plan.splitlines()
+                         if ' posts_post ' in line]
+                self.assertEqual(len(posts), 1, plan)
+                self.assertIn('SEARCH posts_post USING INDEX', posts[0])
+
+
+class PlanProblemsTests(TestCase):
+    def test_index_scan_is_flagged(self):
+        """Просмотр индекса — тоже просмотр, а не поиск."""
+        plan = '7 0 0 SCAN posts_post USING INDEX post_pub_date_idx'
+        self.assertEqual(plan_problems(plan),
+                         ['SCAN posts_post USING INDEX post_pub_date_idx'])
+
+    def test_temp_b_tree_is_flagged(self):
+        plan = ('3 0 0 SEARCH posts_post USING INDEX post_author_idx '
+                '(author_id=?)\n'
+                '9 0 0 USE TEMP B-TREE FOR ORDER BY')
+        self.assertEqual(plan_problems(plan),
+                         ['USE TEMP B-TREE FOR ORDER BY'])
+
+    def test_covering_index_under_search_is_allowed(self):
+        """Покрывающий индекс внутри SEARCH — поиск по ключу, не проблема,
+        а тот же SCAN на верхнем уровне — проблема."""
+        nested = ('2 0 0 SEARCH posts_follow USING INDEX '
+                  'posts_follow_user_id (user_id=?)\n'
+                  '5 2 0 SCAN posts_group USING COVERING INDEX '
+                  'posts_group_slug')
+        self.assertEqual(plan_problems(nested), [])
+        top = '5 0 0 SCAN posts_group USING COVERING INDEX posts_group_slug'
+        self.assertEqual(len(plan_problems(top)), 1)
+
+
+class CommentsPaginationTests(TestCase):
+    COMMENTS = COMMENTS_PER_PAGE + 5
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        for number in range(cls.COMMENTS):
+            commentator = User.objects.create_user(username=f'user{number}')
+            Comment.objects.create(post=cls.post, author=commentator,
+                                   text=f'Комментарий {number}')
+
+    def test_post_detail_renders_first_comments_page(self):
+        """post_detail выводит одну порцию комментариев за постоянное
+        число запросов."""
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(
+                reverse('posts:post_detail', args=[self.post.id]))
+        page = response.context['post_comments']
+        self.assertEqual(len(page), COMMENTS_PER_PAGE)
+        self.assertTrue(page.has_next())
+        self.assertLessEqual(len(captured), 3)
+
+    def test_comments_fragment_returns_next_batch(self):
+        """Фрагмент отдаёт следующую порцию комментариев."""
+        first = self.client.get(reverse(
+            'posts:post_detail', args=[self.post.id])).context['post_comments']
+        response = self.client.get(
+            reverse('posts:post_comments', args=[self.post.id]),
+            {'cursor': first.next_cursor})
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertNotContains(response, '<html')
+        self.assertContains(response, f'Комментарий {self.COMMENTS - 1}')
+        self.assertEqual(len(response.context['post_comments']),
+                         self.COMMENTS - COMMENTS_PER_PAGE)
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .. import thumbnails
+from ..counters import reconcile_media
+from ..models import MediaFile, Post, User
+from ..storage import content_storage
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+OTHER_GIF = SMALL_GIF[:13] + b'\x01' + SMALL_GIF[14:]
+
+
+def uploaded(name, content=SMALL_GIF):
+    return SimpleUploadedFile(name=name, content=content,
+                              content_type='image/gif')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_PROCESSES=0)
+class ContentAddressedStorageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create(self, name, content=SMALL_GIF):
+        return Post.objects.create(author=self.user, text='Пост',
+                                   image=uploaded(name, content))
+
+    def references(self, post):
+        return MediaFile.objects.get(name=post.image.name).references
+
+    def age(self, name, seconds):
+        then = time.time() - seconds
+        os.utime(content_storage.path(name), (then, then))
+
+    def collect(self, *args):
+        call_command('collect_media', *args, stdout=StringIO())
+
+    def test_identical_uploads_share_one_file(self):
+        """Одинаковые картинки хранятся одним файлом под хэшем."""
+        first, second = self.create('meme.gif'), self.create('copy.GIF')
+        digest = hashlib.sha256(SMALL_GIF).hexdigest()
+        self.assertEqual(first.image.name, f'posts/{digest[:2]}/{digest}.gif')
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(self.references(first), 2)
+        other = self.create('meme.gif', OTHER_GIF)
+        self.assertNotEqual(other.image.name, first.image.name)
+
+    def test_thumbnails_are_shared(self):
+        """Миниатюры одной картинки создаются для всех постов разом."""
+        first, second = self.create('meme.gif'), self.create('copy.gif')
+        thumbnails.generate(first)
+        self.assertEqual(thumbnails.generate(second), 0)
+        self.assertIsNotNone(thumbnails.get_existing(second.image, 'card'))
+
+    def test_references_follow_posts(self):
+        """Счётчик ссылок меняется при замене картинки и удалении."""
+        first, second = self.create('meme.gif'), self.create('copy.gif')
+        name = first.image.name
+        second.image = uploaded('other.gif', OTHER_GIF)
+        second.save()
+        self.assertEqual(MediaFile.objects.get(name=name).references, 1)
+        self.assertEqual(self.references(second), 1)
+        first.delete()
+        media = MediaFile.objects.get(name=name)
+        self.assertEqual(media.references, 0)
+        self.assertIsNotNone(media.released)
+
+    def test_collect_removes_only_old_orphans(self):
+        """Сборщик удаляет файлы без ссылок старше отсрочки вместе
+        с миниатюрами и оставляет остальные."""
+        kept = self.create('kept.gif')
+        orphan = self.create('orphan.gif', OTHER_GIF)
+        thumbnails.generate(orphan)
+        thumbnail = thumbnails.get_existing(orphan.image, 'card')
+        name = orphan.image.name
+        orphan.delete()
+        recent = content_storage.save('posts/recent.gif',
+                                      uploaded('recent.gif', b'recent'))
+        stale = content_storage.save('posts/stale.gif',
+                                     uploaded('stale.gif', b'stale'))
+        week = 7 * 24 * 60 * 60
+        for old in (name, stale, kept.image.name):
+            self.age(old, week)
+        MediaFile.objects.filter(name=name).update(
+            released=timezone.now() - timedelta(seconds=week))
+
+        self.collect('--dry-run')
+        self.assertTrue(content_storage.exists(name))
+
+        self.collect()
+        self.assertFalse(content_storage.exists(name))
+        self.assertFalse(content_storage.exists(stale))
+        self.assertFalse(os.path.exists(thumbnail.storage.path(
+            thumbnail.name)))
+        self.assertFalse(MediaFile.objects.filter(name=name).exists())
+        self.assertTrue(content_storage.exists(recent))
+        self.assertTrue(content_storage.exists(kept.image.name))
+
+    def test_collect_spares_recently_released(self):
+        """Файл, оставшийся без ссылок недавно, ждёт отсрочку."""
+        post = self.create('meme.gif')
+        name = post.image.name
+        post.delete()
+        self.age(name, 7 * 24 * 60 * 60)
+        self.collect()
+        self.assertTrue(content_storage.exists(name))
+
+    def test_reconcile_fixes_drifted_counts(self):
+        """Пересчёт восстанавливает ссылки по таблице постов."""
+        post = self.create('meme.gif')
+        MediaFile.objects.all().delete()
+        self.assertEqual(reconcile_media(), 1)
+        self.assertEqual(self.references(post), 1)
@@ -0,0 +1,257 @@
+import shutil
+import tempfile
+from importlib import import_module
+from io import StringIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.models import Job
+
+from .. import thumbnails
+from ..models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+PLACEHOLDER = 'aspect-ratio: 960 / 339'
+image_size_migration = import_module('posts.migrations.0016_post_image_size')
+
+
+def uploaded(name='small.gif', color=0):
+    # Цвет меняет первый цвет палитры: одинаковые файлы хранились бы
+    # одним и делили бы миниатюры.
+    content = SMALL_GIF[:13] + bytes([color]) + SMALL_GIF[14:]
+    return SimpleUploadedFile(name=name, content=content,
+                              content_type='image/gif')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PendingThumbnailTests(TestCase):
+    """Транзакция теста не фиксируется, поэтому очередь не запускается."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test')
+        cls.post = Post.objects.create(author=cls.user, text='Пост',
+                                       image=uploaded())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pending_thumbnail_renders_placeholder(self):
+        """Пока миниатюры нет, страница выводит заглушку и не ждёт."""
+        response = self.client.get(reverse('posts:posts'))
+        self.assertContains(response, PLACEHOLDER)
+        self.assertIsNone(thumbnails.get_existing(self.post.image, 'card'))
+
+    def test_ready_thumbnail_replaces_cached_placeholder(self):
+        """Готовая миниатюра заменяет заглушку в закэшированной карточке."""
+        self.client.get(reverse('posts:posts'))
+        thumbnails.generate(self.post)
+        thumbnail = thumbnails.get_existing(self.post.image, 'card')
+        self.assertIsNotNone(thumbnail)
+        for url in (reverse('posts:posts'),
+                    reverse('posts:post_detail', args=[self.post.pk])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertNotContains(response, PLACEHOLDER)
+                self.assertContains(response, thumbnail.url)
+
+    def test_rolled_back_post_leaves_no_pending_mark(self):
+        """Откат сохранения поста не оставляет отметку ждущей задачи."""
+        jobs = Job.objects.count()
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                post = Post.objects.create(author=self.user, text='Пост',
+                                           image=uploaded(color=1))
+                raise ValueError
+        self.assertEqual(Job.objects.count(), jobs)
+        self.assertIsNone(cache.get(thumbnails.PENDING_KEY.format(post.pk)))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageSizeTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(author=self.user, text='Пост',
+                                        image=uploaded())
+
+    def test_upload_stores_size_and_placeholder(self):
+        """Размеры и заглушка сохраняются вместе с постом."""
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertTrue(post.image_placeholder.startswith(
+            'data:image/webp;base64,'))
+        self.assertLess(len(post.image_placeholder), 1000)
+
+    def test_listing_does_not_open_images(self):
+        """Лента не открывает файлы, даже если размеров нет, а файл
+        потерян."""
+        Post.objects.filter(pk=self.post.pk).update(
+            image='posts/missing.gif', image_width=None, image_height=None)
+        post = Post.objects.for_listing().get(pk=self.post.pk)
+        self.assertIsNone(post.image_width)
+        self.assertEqual(
+            self.client.get(reverse('posts:posts')).status_code, 200)
+
+    def test_card_is_lazy_with_placeholder_background(self):
+        """Карточка грузит картинку лениво, показывая заглушку."""
+        thumbnails.generate(self.post)
+        response = self.client.get(reverse('posts:posts'))
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, self.post.image_placeholder)
+
+    def test_migration_backfills_existing_posts(self):
+        """Миграция заполняет размеры и заглушки старых постов."""
+        Post.objects.filter(pk=self.post.pk).update(
+            image_width=None, image_height=None, image_placeholder='')
+        missing = Post.objects.create(author=self.user, text='Без файла',
+                                      image=uploaded('lost.gif'))
+        Post.objects.filter(pk=missing.pk).update(
+            image='posts/missing.gif', image_width=None, image_height=None)
+        image_size_migration.fill_image_size(apps, None)
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertTrue(post.image_placeholder)
+        self.assertIsNone(Post.objects.get(pk=missing.pk).image_width)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PageThumbnailsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test')
+        cls.posts = [Post.objects.create(author=cls.user, text=f'Пост {i}',
+                                         image=uploaded(f'small{i}.gif', i))
+                     for i in range(3)]
+        cls.posts.append(Post.objects.create(author=cls.user, text='Текст'))
+        for post in cls.posts[:2]:
+            thumbnails.generate(post)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_batch_matches_single_lookups(self):
+        """Пакет страницы находит те же миниатюры, что и поштучный поиск."""
+        thumbnails.prefetch(self.posts, 'card')
+        for post in self.posts[:3]:
+            with self.subTest(post=post.pk):
+                expected = thumbnails.lookup(post.image, 'card')
+                found = thumbnails.find(post, 'card')
+                self.assertEqual(
+                    [getattr(image, 'name', None) for _, image in found],
+                    [getattr(image, 'name', None) for _, image in expected])
+        self.assertFalse(any(
+            image for _, image in thumbnails.find(self.posts[2], 'card')))
+
+    def test_all_variants_are_created(self):
+        """Каждая ширина создаётся в основном формате и в WebP."""
+        found = thumbnails.lookup(self.posts[0].image, 'card')
+        self.assertEqual(
+            [(variant.width, variant.format, image.width)
+             for variant, image in found],
+            [(320, None, 320), (320, 'WEBP', 320), (640, None, 640),
+             (640, 'WEBP', 640), (960, None, 960), (960, 'WEBP', 960)])
+        self.assertTrue(all(image.name.endswith('.webp')
+                            for variant, image in found if variant.format))
+
+    def test_card_renders_srcset_and_dimensions(self):
+        """Карточка выводит srcset обоих форматов и размеры картинки."""
+        image = thumbnails.responsive(
+            thumbnails.lookup(self.posts[0].image, 'card'))
+        response = self.client.get(reverse('posts:posts'))
+        self.assertContains(response, f'srcset="{image.srcset}"')
+        self.assertContains(
+            response, f'<source type="image/webp" '
+                      f'srcset="{image.sources[0]["srcset"]}"')
+        self.assertContains(response, 'width="960" height="339"', count=2)
+        self.assertEqual(image.srcset.count('w, '), 2)
+
+    def test_report_counts_bytes_per_page(self):
+        """Отчёт считает объём страницы до и после по каждой странице."""
+        out = StringIO()
+        call_command('thumbnail_report', '--viewport=320', '--dpr=1',
+                     stdout=out)
+        report = out.getvalue()
+        self.assertIn('Страница 1:', report)
+        self.assertIn('без миниатюр: 1', report)
+        self.assertIn('Всего при ширине 320px', report)
+
+    def test_listing_reads_thumbnails_in_one_query(self):
+        """Миниатюры ленты читаются из базы одним запросом."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:posts'))
+        kvstore_queries = [query['sql'] for query in queries.captured_queries
+                           if 'thumbnail_kvstore' in query['sql']]
+        self.assertEqual(len(kvstore_queries), 1)
+        self.assertContains(response, 'class="card-img my-2" src', count=2)
+        self.assertContains(response, PLACEHOLDER, count=1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, JOBS_EAGER=True)
+class EagerThumbnailTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Test')
+        self.client.force_login(self.user)
+
+    def test_thumbnails_are_created_on_upload(self):
+        """Миниатюры создаются при сохранении поста, а не при показе."""
+        self.client.post(reverse('posts:post_create'),
+                         {'text': 'Пост', 'image': uploaded()})
+        post = Post.objects.get()
+        self.assertIsNotNone(thumbnails.get_existing(post.image, 'card'))
+        self.assertNotContains(self.client.get(reverse('posts:posts')),
+                               PLACEHOLDER)
+
+    def test_command_creates_missing_variants(self):
+        """Команда досоздаёт варианты новой ширины у старых постов."""
+        post = Post.objects.create(author=self.user, text='Пост',
+                                   image=uploaded())
+        with override_settings(POST_THUMBNAIL_WIDTHS=(480, 960)):
+            call_command('generate_thumbnails', '--batch=1', stdout=StringIO())
+            found = thumbnails.lookup(post.image, 'card')
+        self.assertEqual([variant.width for variant, _ in found],
+                         [480, 480, 960, 960])
+        self.assertTrue(all(image for _, image in found))
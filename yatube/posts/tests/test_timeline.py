@@ -0,0 +1,159 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.jobs import run_pending
+
+from ..models import Follow, Post, TimelineEntry, User
+from ..timeline import trim_timelines
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def setUp(self):
+        self.reader_client = self.client_class()
+        self.reader_client.force_login(self.reader)
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост попадает в ленты подписчиков автора."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertFalse(TimelineEntry.objects.exists())
+        run_pending()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+
+    def test_follow_and_unfollow_update_timeline(self):
+        """Подписка добавляет старые посты автора, отписка убирает их."""
+        post = Post.objects.create(author=self.author, text='Старый пост')
+        self.reader_client.get(reverse('posts:profile_follow',
+                                       args=[self.author.username]))
+        self.assertTrue(self.reader.timeline.filter(post=post).exists())
+        self.reader_client.get(reverse('posts:profile_unfollow',
+                                       args=[self.author.username]))
+        self.assertFalse(self.reader.timeline.exists())
+
+    def test_deleted_post_leaves_timeline(self):
+        """Удалённый пост пропадает из лент."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Удалим')
+        post.delete()
+        self.assertFalse(self.reader.timeline.exists())
+
+    @override_settings(TIMELINE_MAX_LENGTH=3)
+    def test_timeline_is_capped(self):
+        """Лента хранит не больше TIMELINE_MAX_LENGTH последних постов."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [Post.objects.create(author=self.author, text=str(i))
+                 for i in range(5)]
+        run_pending()
+        self.assertEqual(
+            set(self.reader.timeline.values_list('post_id', flat=True)),
+            {post.id for post in posts[-3:]})
+
+    @override_settings(TIMELINE_MAX_LENGTH=2)
+    def test_trim_is_one_query_for_all_followers(self):
+        """Ленты всех подписчиков обрезаются одним запросом."""
+        readers = [User.objects.create_user(username=f'follower{i}')
+                   for i in range(3)]
+        posts = [Post.objects.create(author=self.author, text=str(i))
+                 for i in range(4)]
+        TimelineEntry.objects.bulk_create(
+            TimelineEntry(user=reader, post=post, pub_date=post.pub_date)
+            for reader in readers for post in posts)
+        with CaptureQueriesContext(connection) as queries:
+            trim_timelines([reader.pk for reader in readers])
+        self.assertEqual(len(queries), 1)
+        for reader in readers:
+            self.assertEqual(
+                set(reader.timeline.values_list('post_id', flat=True)),
+                {post.id for post in posts[-2:]})
+
+    def test_backfill_command_restores_timelines(self):
+        """Команда backfill_timelines восстанавливает ленты."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Пост')
+        TimelineEntry.objects.all().delete()
+        call_command('backfill_timelines', stdout=StringIO())
+        self.assertTrue(self.reader.timeline.filter(post=post).exists())
+
+
+class FanOutEtagTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.reader_client = self.client_class()
+        self.reader_client.force_login(self.reader)
+
+    def test_fan_out_changes_follow_etag(self):
+        """Лента, открытая до раскладки поста, после неё не отвечает 304."""
+        url = reverse('posts:follow_index')
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        etag = self.reader_client.get(url)['ETag']
+        run_pending()
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(post, response.context['page_obj'])
+
+
+@override_settings(FOLLOW_FEED='merge', AUTHOR_TIMELINE_LENGTH=4)
+class MergedFeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        for number in range(3):
+            author = User.objects.create_user(username=f'author{number}')
+            Follow.objects.create(user=cls.reader, author=author)
+            for i in range(5):
+                Post.objects.create(author=author, text=f'{number}-{i}')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = self.client_class()
+        self.reader_client.force_login(self.reader)
+
+    def test_merged_feed_matches_join(self):
+        """Слияние лент авторов даёт тот же порядок, что и JOIN,
+        в том числе на страницах глубже закэшированных списков."""
+        expected = list(Post.objects.filter(
+            author__following__user=self.reader).order_by('-pub_date', '-id'))
+        shown, params = [], {}
+        while True:
+            page = self.reader_client.get(
+                reverse('posts:follow_index'), params).context['page_obj']
+            shown.extend(page.object_list)
+            if not page.has_next():
+                break
+            params = {'cursor': page.next_cursor}
+        self.assertEqual(shown, expected)
+
+    def test_new_post_updates_cached_author_list(self):
+        """Новый пост сразу виден в ленте, собранной из кэша."""
+        self.reader_client.get(reverse('posts:follow_index'))
+        author = User.objects.get(username='author0')
+        post = Post.objects.create(author=author, text='Свежий')
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], post)
+
+    def test_deleted_post_leaves_cached_author_list(self):
+        """Удалённый пост сразу пропадает из ленты, собранной из кэша."""
+        first = self.reader_client.get(
+            reverse('posts:follow_index')).context['page_obj'][0]
+        first.delete()
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertNotIn(first, response.context['page_obj'])
@@ -1,13 +1,19 @@
 import tempfile
 import shutil
 from django.core.cache import cache
-from django.test import Client, TestCase, override_settings
+from io import StringIO
+from django.core.management import call_command
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.urls import reverse
 from ..models import Post, Group, Comment, Follow, User
 from django import forms
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from http import HTTPStatus
+from core.cache import get_stats, reset_stats
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -222,20 +228,102 @@ class ViewsPagesTests(TestCase):
                 self.assertRedirects(response, target_url)
 
     def test_cache_working_in_index_page(self):
-        """Проверяет работу кэша на главной странице"""
-        Post.objects.create(
+        """Главная страница берётся из кэша, пока не изменятся посты"""
+        post = Post.objects.create(
             author=self.user,
             text='Пост для кэша',
             group=self.group,
         )
         self.guest_client.get(reverse('posts:posts'))
-        Post.objects.first().delete()
+        Post.objects.filter(pk=post.pk).update(text='Изменён в обход сигналов')
         self.assertContains(self.guest_client.get(reverse('posts:posts')),
                             'Пост для кэша', status_code=200)
-        cache.clear()
+        post.delete()
         self.assertNotContains(self.guest_client.get(reverse('posts:posts')),
                                'Пост для кэша')
 
+    def test_post_edit_invalidates_cached_pages(self):
+        """Правка поста сразу видна на закэшированных страницах группы,
+        профиля и главной"""
+        urls = (
+            reverse('posts:posts'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.user.username]),
+        )
+        for url in urls:
+            self.guest_client.get(url)
+        self.authorized_client.post(
+            reverse('posts:post_edit', args=[self.post.id]),
+            data={'text': 'Отредактированный пост', 'group': self.group.id})
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url),
+                                    'Отредактированный пост')
+
+    def test_unchanged_pages_answer_not_modified(self):
+        """Неизменившиеся страницы отдаются ответом 304 без рендеринга"""
+        urls = (
+            reverse('posts:posts'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.user.username]),
+            reverse('posts:post_detail', args=[self.post.id]),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertIn('Cookie', response['Vary'])
+                etag = response['ETag']
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+                self.assertIsNone(response.context)
+
+    def test_etag_changes_with_content_and_viewer(self):
+        """ETag меняется при новых данных и для другого пользователя"""
+        url = reverse('posts:post_detail', args=[self.post.id])
+        etag = self.authorized_client.get(url)['ETag']
+        self.assertNotEqual(self.guest_client.get(url)['ETag'], etag)
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Новый комментарий')
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(response, 'Новый комментарий')
+
+    def test_etag_changes_when_commenter_renames(self):
+        """ETag поста меняется, когда комментатор меняет имя"""
+        commenter = User.objects.create_user(username='Commenter')
+        Comment.objects.create(post=self.post, author=commenter,
+                               text='Комментарий')
+        url = reverse('posts:post_detail', args=[self.post.id])
+        etag = self.guest_client.get(url)['ETag']
+        commenter.username = 'Renamed'
+        commenter.save()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(response, 'Renamed')
+
+    def test_etag_survives_signup_and_unchanged_save(self):
+        """Регистрация и сохранение без смены имени не сбрасывают ETag"""
+        url = reverse('posts:posts')
+        etag = self.guest_client.get(url)['ETag']
+        User.objects.create_user(username='Newcomer')
+        self.user.email = 'test@example.com'
+        self.user.save()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_profile_etag_changes_when_owner_follows(self):
+        """ETag профиля меняется, когда владелец на кого-то подписался"""
+        url = reverse('posts:profile', args=[self.user.username])
+        etag = self.guest_client.get(url)['ETag']
+        Follow.objects.create(
+            user=self.user,
+            author=User.objects.create_user(username='Followed'))
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
     def test_user_follow(self):
         """Авторизованный пользователь может подписываться на
           других пользователей"""
@@ -324,3 +412,106 @@ class PaginatorViewsTest(TestCase):
             response = self.client.get(url)
             self.assertEqual(
                 len(response.context.get('page_obj').object_list), 3)
+
+    def test_cursor_pages_walk_whole_feed(self):
+        """Курсоры next/prev проходят ленту без пропусков и повторов."""
+        first = self.client.get(reverse('posts:posts')).context['page_obj']
+        self.assertTrue(first.has_next())
+        self.assertFalse(first.has_previous())
+        second = self.client.get(
+            reverse('posts:posts'),
+            {'cursor': first.next_cursor}).context['page_obj']
+        self.assertEqual(second.number, 2)
+        self.assertFalse(second.has_next())
+        shown = list(first.object_list) + list(second.object_list)
+        self.assertEqual(shown, list(Post.objects.order_by('-pub_date',
+                                                           '-id')))
+        back = self.client.get(
+            reverse('posts:posts'),
+            {'cursor': second.previous_cursor}).context['page_obj']
+        self.assertEqual(list(back.object_list), list(first.object_list))
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный курсор ведёт на первую страницу."""
+        response = self.client.get(reverse('posts:posts'),
+                                   {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.context['page_obj'].number, 1)
+
+    def test_cursor_paginator_does_not_count(self):
+        """Пагинация по курсору не выполняет COUNT(*)."""
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse('posts:posts'))
+        self.assertFalse(any('COUNT(' in query['sql']
+                             for query in captured.captured_queries))
+
+
+class PostCardCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test')
+        cls.posts = [Post.objects.create(author=cls.user,
+                                         text=f'Тестовый пост - {i}')
+                     for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_edit_invalidates_only_own_card(self):
+        """После правки поста пересчитывается только его карточка."""
+        self.client.get(reverse('posts:posts'))
+        post = self.posts[0]
+        self.authorized_client.post(
+            reverse('posts:post_edit', args=[post.id]),
+            {'text': 'Исправленный текст'})
+        reset_stats()
+        response = self.client.get(reverse('posts:posts'))
+        self.assertContains(response, 'Исправленный текст')
+        stats = get_stats()
+        # Промахи: страница целиком и карточка исправленного поста.
+        self.assertEqual(stats['miss'], 2)
+        self.assertEqual(stats['hit'], len(self.posts) - 1)
+
+    def test_profile_cards_have_no_author_link(self):
+        """Карточки в профиле не ссылаются на профиль автора."""
+        url = reverse('posts:profile', args=[self.user.username])
+        link = f'href="{url}"'
+        self.assertNotContains(self.client.get(url), link)
+        self.assertContains(self.client.get(reverse('posts:posts')), link,
+                            count=len(self.posts))
+
+    def test_cached_listing_does_not_query_posts(self):
+        """Лента из кэша фрагментов не читает посты из базы."""
+        url = reverse('posts:posts')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertContains(response, self.posts[0].text)
+        self.assertFalse([query['sql'] for query in captured
+                          if '"posts_post"' in query['sql']])
+
+
+class WarmCacheTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='Test')
+        group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(13):
+            Post.objects.create(author=user, group=group,
+                                text=f'Тестовый пост - {i}')
+
+    def test_warm_cache_renders_listing_pages(self):
+        """warm_cache рендерит страницы лент, и они берутся из кэша."""
+        out = StringIO()
+        call_command('warm_cache', '--workers=3', stdout=out)
+        self.assertIn('Прогрето страниц: 6 из 6', out.getvalue())
+        reset_stats()
+        self.client.get(reverse('posts:posts'))
+        self.assertEqual(get_stats()['hit'], 1)
+        self.assertEqual(get_stats()['miss'], 0)
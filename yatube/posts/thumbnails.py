@@ -0,0 +1,358 @@
+"""Миниатюры картинок постов, которые создаются заранее в фоне.
+
+Каждая миниатюра из ``settings.POST_THUMBNAILS`` создаётся в нескольких
+ширинах (``POST_THUMBNAIL_WIDTHS``) и форматах: основном и дополнительных
+из ``POST_THUMBNAIL_FORMATS``, чтобы браузер выбрал вариант по ``srcset``.
+Как только пост с картинкой сохранён, создание всех недостающих
+вариантов ставится одной задачей в очередь ``core.jobs``; воркер
+кодирует их в пуле процессов, декодируя картинку один раз, а картинки
+разных постов обрабатываются параллельно.
+
+Шаблоны берут миниатюру тегом ``{% post_thumbnail %}``, который сам
+её не создаёт: пока основного варианта нет, выводится заглушка того же
+размера, а создание ставится в очередь. Готовая миниатюра меняет
+``Post.modified`` и поколения поста, поэтому кэшированные карточки
+и страницы с заглушкой перерисовываются.
+
+Ленты читают миниатюры всех постов страницы разом: тег
+``{% prefetch_thumbnails %}`` связывает посты с ``PageThumbnails``,
+которая при первом обращении читает их одним запросом к кэшу
+и не больше чем одним — к базе ``KVStore``.
+"""
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend as SorlThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import \
+    KVStore as CachedDBKVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+from sorl.thumbnail.parsers import parse_geometry
+
+from core.jobs import job
+
+from . import generations
+from .models import Post
+from .object_cache import forget_pk
+
+PENDING_KEY = 'thumbnail_pending:{}'
+PENDING_TIMEOUT = 5 * 60
+
+# Вариант миниатюры: ``format`` равен None у основного формата.
+Variant = namedtuple('Variant', 'geometry options width format')
+
+
+class KVStore(CachedDBKVStore):
+    def get_many(self, image_files):
+        """Как ``get`` для нескольких файлов сразу: один запрос к кэшу
+        и один к базе за теми, которых в кэше нет. Возвращает список
+        в порядке ``image_files``."""
+        keys = [add_prefix(image_file.key) for image_file in image_files]
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            stored = dict(KVStoreModel.objects.filter(
+                key__in=missing).values_list('key', 'value'))
+            # Как в ``_get_raw``: отсутствие тоже запоминается в кэше.
+            found = {key: stored.get(key, EMPTY_VALUE) for key in missing}
+            self.cache.set_many(found, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(found)
+        return [None if values[key] == EMPTY_VALUE
+                else deserialize_image_file(values[key]) for key in keys]
+
+
+class ThumbnailBackend(SorlThumbnailBackend):
+    def get_existing(self, file_, geometry_string, **options):
+        """Готовая миниатюра или None; в отличие от ``get_thumbnail``
+        ничего не создаёт."""
+        return default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, options))
+
+    def get_existing_many(self, requests):
+        """``get_existing`` для списка ``(file_, geometry, options)``
+        одним обращением к хранилищу ключей."""
+        return default.kvstore.get_many(
+            [self.thumbnail_file(file_, geometry_string, options)
+             for file_, geometry_string, options in requests])
+
+    def thumbnail_file(self, file_, geometry_string, options):
+        return self.prepare(file_, geometry_string, options)[1]
+
+    def prepare(self, file_, geometry_string, options):
+        """Полные параметры и файл миниатюры, как их построит
+        ``get_thumbnail``."""
+        source = ImageFile(file_)
+        options = self.normalize_options(source, options)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return options, ImageFile(name, default.storage)
+
+    def normalize_options(self, source, options):
+        # Те же значения по умолчанию, что в ``get_thumbnail``: от них
+        # зависит имя файла миниатюры.
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+
+backend = ThumbnailBackend()
+
+
+def variants(name):
+    """Варианты миниатюры ``name`` от узких к широким. Основной формат
+    самой широкой совпадает с миниатюрой из ``POST_THUMBNAILS``."""
+    geometry, options = settings.POST_THUMBNAILS[name]
+    width, _, height = geometry.partition('x')
+    width = int(width)
+    widths = sorted(
+        {w for w in settings.POST_THUMBNAIL_WIDTHS if w < width} | {width})
+    result = []
+    for w in widths:
+        variant_geometry = geometry
+        if w != width:
+            variant_geometry = str(w)
+            if height:
+                variant_geometry += f'x{round(int(height) * w / width)}'
+        for format_ in (None, *settings.POST_THUMBNAIL_FORMATS):
+            variant_options = dict(options)
+            if format_ is not None:
+                variant_options['format'] = format_
+            result.append(Variant(variant_geometry, variant_options, w,
+                                  format_))
+    return result
+
+
+class Placeholder:
+    """Заглушка на месте миниатюры, которая ещё создаётся."""
+    url = None
+
+    def __init__(self, geometry):
+        width, _, height = geometry.partition('x')
+        self.width, self.height = width, height or width
+
+
+class ResponsiveImage:
+    """Готовые варианты миниатюры для ``<picture>``: ``url``, размеры
+    и ``srcset`` основного формата и ``sources`` остальных форматов."""
+
+    def __init__(self, found):
+        ready = [(variant, image) for variant, image in found if image]
+        main = [image for variant, image in ready if variant.format is None]
+        self.image = main[-1]
+        self.url = self.image.url
+        self.width, self.height = self.image.width, self.image.height
+        self.srcset = self._srcset(main)
+        self.sources = []
+        for format_ in settings.POST_THUMBNAIL_FORMATS:
+            images = [image for variant, image in ready
+                      if variant.format == format_]
+            if images:
+                self.sources.append({'type': f'image/{format_.lower()}',
+                                     'srcset': self._srcset(images)})
+
+    @staticmethod
+    def _srcset(images):
+        return ', '.join(f'{image.url} {image.width}w' for image in images)
+
+
+def responsive(found):
+    """``ResponsiveImage`` или None, если нет основного варианта."""
+    main = [image for variant, image in found if variant.format is None]
+    if not main[-1]:
+        return None
+    return ResponsiveImage(found)
+
+
+def lookup(image, name):
+    """Пары ``(вариант, миниатюра или None)`` миниатюры ``name``."""
+    name_variants = variants(name)
+    found = backend.get_existing_many(
+        [(image, variant.geometry, variant.options)
+         for variant in name_variants])
+    return list(zip(name_variants, found))
+
+
+def get_existing(image, name):
+    """Основной вариант миниатюры или None."""
+    geometry, options = settings.POST_THUMBNAILS[name]
+    return backend.get_existing(image, geometry, **options)
+
+
+class PageThumbnails:
+    """Миниатюры ``name`` постов одной страницы. Читаются при первом
+    обращении, то есть только если хоть одна карточка не нашлась
+    в кэше фрагментов."""
+
+    def __init__(self, posts, name):
+        self.posts = [post for post in posts if post.image]
+        self.name = name
+        self.found = None
+
+    def get(self, post):
+        if self.found is None:
+            name_variants = variants(self.name)
+            found = iter(backend.get_existing_many(
+                [(post.image, variant.geometry, variant.options)
+                 for post in self.posts for variant in name_variants]))
+            self.found = {
+                post.pk: [(variant, next(found)) for variant in name_variants]
+                for post in self.posts}
+        if post.pk not in self.found:
+            return lookup(post.image, self.name)
+        return self.found[post.pk]
+
+
+def prefetch(posts, name):
+    """Связывает посты страницы с общей ``PageThumbnails``."""
+    posts = list(posts)
+    batch = PageThumbnails(posts, name)
+    for post in posts:
+        if not hasattr(post, 'page_thumbnails'):
+            post.page_thumbnails = {}
+        post.page_thumbnails[name] = batch
+
+
+def find(post, name):
+    """Варианты миниатюры поста: из пакета страницы, если он есть."""
+    batch = getattr(post, 'page_thumbnails', {}).get(name)
+    if batch is not None:
+        return batch.get(post)
+    return lookup(post.image, name)
+
+
+class _Source:
+    """Прочитанная картинка для ``engine.get_image`` в другом процессе."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+def _render(data, jobs):
+    """Декодирует картинку один раз и кодирует все варианты ``jobs``
+    (пары ``(geometry, options)``). Выполняется в пуле процессов."""
+    engine = default.engine
+    source_image = engine.get_image(_Source(data))
+    image_info = engine.get_image_info(source_image)
+    rendered = []
+    try:
+        for geometry_string, options in jobs:
+            ratio = engine.get_image_ratio(source_image, options)
+            geometry = parse_geometry(geometry_string, ratio)
+            image = engine.create(source_image, geometry, options)
+            raw_data = engine._get_raw_data(
+                image, options['format'], options['quality'],
+                image_info=image_info,
+                progressive=options.get(
+                    'progressive', sorl_settings.THUMBNAIL_PROGRESSIVE))
+            rendered.append((raw_data, engine.get_image_size(image)))
+        return engine.get_image_size(source_image), rendered
+    finally:
+        engine.cleanup(source_image)
+
+
+def encode(data, jobs):
+    """``_render`` в пуле процессов или, если он выключен, здесь же."""
+    if settings.THUMBNAIL_PROCESSES:
+        return _get_processes().submit(_render, data, jobs).result()
+    return _render(data, jobs)
+
+
+def render(image, missing):
+    """Создаёт варианты ``missing`` картинки и записывает их в хранилище
+    и ``KVStore``. Кодирование идёт в пуле процессов, если он включён."""
+    source = ImageFile(image)
+    prepared = [backend.prepare(image, variant.geometry, variant.options)
+                for variant in missing]
+    jobs = [(variant.geometry, options)
+            for variant, (options, _) in zip(missing, prepared)]
+    source_size, rendered = encode(source.read(), jobs)
+    source.set_size(source_size)
+    default.kvstore.get_or_set(source)
+    for (_, thumbnail), (raw_data, size) in zip(prepared, rendered):
+        # Хранилище не перезаписывает файлы, а добавляет к имени суффикс.
+        if sorl_settings.THUMBNAIL_FORCE_OVERWRITE or not thumbnail.exists():
+            thumbnail.write(raw_data)
+        thumbnail.set_size(size)
+        default.kvstore.set(thumbnail, source)
+
+
+def generate(post):
+    """Создаёт недостающие варианты миниатюр поста и отмечает пост
+    изменённым. Возвращает число созданных вариантов."""
+    missing = []
+    try:
+        for name in settings.POST_THUMBNAILS:
+            missing += [variant for variant, image in lookup(post.image, name)
+                        if image is None]
+        if missing:
+            render(post.image, missing)
+    finally:
+        cache.delete(PENDING_KEY.format(post.pk))
+    if missing:
+        Post.objects.filter(pk=post.pk).update(modified=timezone.now())
+        forget_pk(Post, post.pk)
+        generations.post_changed(post)
+    return len(missing)
+
+
+_processes = None
+_processes_pid = None
+_processes_lock = threading.Lock()
+
+
+def _get_processes():
+    global _processes, _processes_pid
+    with _processes_lock:
+        # Пул родителя после fork непригоден: его потоков в потомке нет.
+        if _processes is None or _processes_pid != os.getpid():
+            _processes = ProcessPoolExecutor(
+                max_workers=settings.THUMBNAIL_PROCESSES,
+                initializer=django.setup)
+            _processes_pid = os.getpid()
+        return _processes
+
+
+@job(concurrency=2)
+def generate_thumbnails(post_id):
+    """Задача очереди: миниатюры поста, если он ещё существует."""
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or not post.image:
+        cache.delete(PENDING_KEY.format(post_id))
+        return
+    generate(post)
+
+
+def schedule(post):
+    """Ставит создание миниатюр поста в очередь задач; повторные вызовы,
+    пока задача ждёт, ничего не делают."""
+    if not post.image:
+        return
+    key = PENDING_KEY.format(post.pk)
+    if cache.get(key):
+        return
+    if generate_thumbnails.enqueue(post_id=post.pk, key=key) is not None:
+        # Отметка появляется, только если задача зафиксирована: после
+        # отката транзакции миниатюры можно поставить снова.
+        transaction.on_commit(partial(cache.set, key, 1, PENDING_TIMEOUT))
@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from core.jobs import job
+
+from . import generations
+from .author_timelines import get_merged_page
+from .models import Follow, Post, TimelineEntry
+from .utils import get_paginator
+
+TIMELINE_ORDERING = ('-pub_date', '-post_id')
+# Сколько лент обрезать одним запросом.
+TRIM_BATCH_SIZE = 500
+
+
+def trim_timelines(user_ids):
+    """Обрезает ленты до ``settings.TIMELINE_MAX_LENGTH`` записей одним
+    DELETE на пачку читателей: лишние записи находит нумерация строк
+    в окне каждого читателя."""
+    limit = settings.TIMELINE_MAX_LENGTH
+    if not limit:
+        return
+    user_ids = list(user_ids)
+    table = connection.ops.quote_name(TimelineEntry._meta.db_table)
+    for start in range(0, len(user_ids), TRIM_BATCH_SIZE):
+        ranked = TimelineEntry.objects.filter(
+            user_id__in=user_ids[start:start + TRIM_BATCH_SIZE]).annotate(
+            position=Window(
+                RowNumber(), partition_by=[F('user_id')],
+                order_by=[F(field[1:]).desc()
+                          for field in TIMELINE_ORDERING])
+        ).values('id', 'position')
+        sql, params = ranked.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE id IN (SELECT id FROM ({sql}) '
+                f'ranked WHERE position > %s)', [*params, limit])
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    follower_ids = list(Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True))
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in follower_ids),
+        ignore_conflicts=True)
+    trim_timelines(follower_ids)
+    # ETag ленты подписок уже сменился при сохранении поста: без этого
+    # читатель, открывший ленту до раскладки, получал бы 304 без поста.
+    transaction.on_commit(
+        lambda: generations.timelines_changed(follower_ids))
+
+
+@job(concurrency=4)
+def fan_out(post_id):
+    """Задача очереди: ``fan_out_post`` для поста, если он ещё есть.
+    Подписчики читаются при выполнении, поэтому подписки, изменённые
+    за время ожидания, учтены."""
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None:
+        fan_out_post(post)
+
+
+def add_author(user_id, author_id):
+    """Добавляет в ленту читателя последние посты нового автора."""
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id').values_list('id', 'pub_date')
+    limit = settings.TIMELINE_MAX_LENGTH
+    if limit:
+        posts = posts[:limit]
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts),
+        ignore_conflicts=True)
+    trim_timelines([user_id])
+
+
+def remove_author(user_id, author_id):
+    """Убирает из ленты читателя посты автора, от которого он отписался."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def get_timeline_page(request, user):
+    """Страница ленты подписок: диапазон по индексу и один запрос
+    за постами страницы."""
+    page_obj = get_paginator(request, user.timeline.all(), TIMELINE_ORDERING)
+    post_ids = [entry.post_id for entry in page_obj.object_list]
+    posts = Post.objects.for_listing().order_by().in_bulk(post_ids)
+    page_obj.object_list = [
+        posts[post_id] for post_id in post_ids if post_id in posts]
+    return page_obj
+
+
+def get_follow_page(request, user):
+    """Страница ленты подписок способом из ``settings.FOLLOW_FEED``."""
+    if settings.FOLLOW_FEED == 'merge':
+        return get_merged_page(request, user)
+    return get_timeline_page(request, user)
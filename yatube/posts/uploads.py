@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.files.uploadhandler import (StopUpload,
+                                             TemporaryFileUploadHandler)
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку сразу во временный файл, не держа её в памяти.
+    После ``POST_IMAGE_MAX_BYTES`` разбор запроса обрывается, не дочитывая
+    тело, а запрос помечается ``upload_oversized``; форма поста тогда
+    отклоняет картинку."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_BYTES:
+            self.request.upload_oversized = True
+            raise StopUpload(connection_reset=True)
+        return super().receive_data_chunk(raw_data, start)
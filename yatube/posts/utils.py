@@ -1,10 +1,257 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
 
 
 POST_PER_PAGE = 10
+POST_ORDERING = ('-pub_date', '-id')
+COMMENTS_PER_PAGE = 20
+COMMENT_ORDERING = ('created', 'id')
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage(Page):
+    """Страница курсорной пагинации.
+
+    Совместима с ``Page`` для шаблонов, но не знает общего числа страниц:
+    вместо номеров соседних страниц отдаёт непрозрачные курсоры.
+    """
+
+    def __init__(self, object_list, number, paginator, cursor=None,
+                 next_cursor=None, previous_cursor=None):
+        super().__init__(object_list, number, paginator)
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Page %s %s>' % (self.number, self.cursor or '')
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def start_index(self):
+        if not self.object_list:
+            return 0
+        return (self.number - 1) * self.paginator.per_page + 1
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1
+
+
+def _delegated(name):
+    return property(lambda self: getattr(self.loaded(), name),
+                    lambda self, value: setattr(self.loaded(), name, value))
+
+
+class LazyCursorPage(CursorPage):
+    """Страница, которая читает базу при первом обращении к записям или
+    курсорам, а не при создании.
+
+    ``str()`` страницы строится по параметрам запроса без чтения базы,
+    поэтому она годится в ключ ``{% fresh_cache %}``: если фрагмент
+    ленты вместе с пагинатором нашёлся в кэше, запроса за страницей нет.
+    """
+    object_list = _delegated('object_list')
+    number = _delegated('number')
+    paginator = _delegated('paginator')
+    cursor = _delegated('cursor')
+    next_cursor = _delegated('next_cursor')
+    previous_cursor = _delegated('previous_cursor')
+
+    def __init__(self, load, key):
+        self._load = load
+        self._page = None
+        self._key = key
+
+    def __repr__(self):
+        return f'<Page {self._key}>'
+
+    def loaded(self):
+        if self._page is None:
+            self._page = self._load()
+        return self._page
 
 
-def get_paginator(request, *args):
+class CursorPaginator(Paginator):
+    """Пагинация по ключу (keyset) без COUNT(*) и OFFSET.
+
+    Страница выбирается условием «строго после/до граничной записи»
+    по полям ``ordering``, поэтому стоимость запроса не зависит
+    от глубины страницы. Последнее поле ordering должно быть уникальным.
+    """
+
+    def __init__(self, object_list, per_page, ordering=POST_ORDERING):
+        self.ordering = tuple(ordering)
+        super().__init__(object_list.order_by(*self.ordering), per_page)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+
+    def _key_field(self, name):
+        return self.object_list.model._meta.get_field(name)
+
+    def encode_cursor(self, obj, number, backwards=False):
+        values = [
+            self._key_field(name).value_to_string(obj)
+            for name in self.fields]
+        data = json.dumps([number, int(backwards), values])
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            number, backwards, raw = json.loads(
+                base64.urlsafe_b64decode(padded.encode()).decode())
+            values = [
+                self._key_field(name).to_python(value)
+                for name, value in zip(self.fields, raw)]
+        except (ValueError, TypeError, binascii.Error,
+                ValidationError) as error:
+            raise InvalidCursor(cursor) from error
+        if (len(values) != len(self.fields) or None in values
+                or not isinstance(number, int) or number < 1):
+            raise InvalidCursor(cursor)
+        return number, bool(backwards), values
+
+    def _seek(self, values, backwards):
+        """Условие «после граничной записи» в порядке ordering
+        (при ``backwards`` — «до неё»).
+
+        Перед разложением по полям стоит нестрогая граница первого поля:
+        ``pub_date <= v AND (pub_date < v OR pub_date = v AND id < y)``.
+        По ней SQLite ищет диапазон в индексе (SEARCH), а не просматривает
+        индекс с начала (SCAN), и глубокие страницы не дорожают.
+        """
+        condition = Q()
+        for position in reversed(range(len(self.fields))):
+            name = self.fields[position]
+            lookup = self._lookup(position, backwards)
+            step = Q(**{f'{name}__{lookup}': values[position]})
+            if position < len(self.fields) - 1:
+                step |= Q(**{name: values[position]}) & condition
+            condition = step
+        if len(self.fields) > 1:
+            lookup = self._lookup(0, backwards, inclusive=True)
+            condition = Q(**{f'{self.fields[0]}__{lookup}': values[0]}) & (
+                condition)
+        return condition
+
+    def _lookup(self, position, backwards, inclusive=False):
+        descending = self.ordering[position].startswith('-')
+        lookup = 'lt' if descending != backwards else 'gt'
+        return f'{lookup}e' if inclusive else lookup
+
+    def _reversed_ordering(self):
+        return [
+            name[1:] if name.startswith('-') else f'-{name}'
+            for name in self.ordering]
+
+    def build_page(self, items, number, cursor, has_next, has_previous):
+        next_cursor = previous_cursor = None
+        if items and has_next:
+            next_cursor = self.encode_cursor(items[-1], number + 1)
+        if items and has_previous:
+            previous_cursor = self.encode_cursor(
+                items[0], max(number - 1, 1), backwards=True)
+        return CursorPage(items, number, self, cursor,
+                          next_cursor, previous_cursor)
+
+    def page_queryset(self, values=None, backwards=False):
+        """Запрос одной страницы после граничной записи ``values``
+        (с одной лишней записью, чтобы узнать о следующей странице)."""
+        queryset = self.object_list
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, backwards))
+        ordering = (self._reversed_ordering() if backwards
+                    else self.ordering)
+        return queryset.order_by(*ordering)[:self.per_page + 1]
+
+    def first_page(self):
+        items = list(self.page_queryset())
+        has_next = len(items) > self.per_page
+        return self.build_page(items[:self.per_page], 1, None,
+                               has_next, False)
+
+    def get_page(self, cursor):
+        """Возвращает страницу по курсору.
+
+        Пустой или испорченный курсор ведёт на первую страницу.
+        """
+        if not cursor:
+            return self.first_page()
+        try:
+            number, backwards, values = self.decode_cursor(cursor)
+        except InvalidCursor:
+            return self.first_page()
+        items = list(self.page_queryset(values, backwards))
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if backwards:
+            if not has_more:
+                # Дошли до начала ленты: первая страница всегда полная.
+                return self.first_page()
+            items.reverse()
+            return self.build_page(items, number, cursor, True, True)
+        return self.build_page(items, number, cursor, has_more, True)
+
+    def get_numbered_page(self, number):
+        """Страница по номеру для старых ссылок вида ``?page=N``.
+
+        Использует OFFSET, но не считает общее число записей.
+        """
+        try:
+            number = max(int(number), 1)
+        except (TypeError, ValueError):
+            number = 1
+        if number == 1:
+            return self.first_page()
+        offset = (number - 1) * self.per_page
+        items = list(
+            self.object_list.order_by(*self.ordering)
+            [offset:offset + self.per_page + 1])
+        if not items:
+            return self.first_page()
+        has_next = len(items) > self.per_page
+        return self.build_page(items[:self.per_page], number, None,
+                               has_next, True)
+
+
+def get_paginator(request, queryset, ordering=POST_ORDERING,
+                  per_page=POST_PER_PAGE):
+    paginator = CursorPaginator(queryset, per_page, ordering)
+    cursor = request.GET.get('cursor')
     page_number = request.GET.get('page')
-    page_obj = Paginator(*args, POST_PER_PAGE).get_page(page_number)
-    return page_obj
+    if not cursor and page_number:
+        return paginator.get_numbered_page(page_number)
+    return paginator.get_page(cursor)
+
+
+def get_lazy_page(request, queryset, ordering=POST_ORDERING,
+                  per_page=POST_PER_PAGE):
+    """``get_paginator``, отложенный до первого обращения к странице."""
+    key = '|'.join((request.GET.get('cursor', ''),
+                    request.GET.get('page', '')))
+    return LazyCursorPage(
+        lambda: get_paginator(request, queryset, ordering, per_page), key)
+
+
+def get_comments_page(request, post):
+    """Порция комментариев поста вместе с авторами, от старых к новым."""
+    comments = post.comments.select_related('author')
+    return get_paginator(request, comments, COMMENT_ORDERING,
+                         COMMENTS_PER_PAGE)
@@ -1,57 +1,86 @@
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.views.decorators.http import etag
+from django.views.decorators.vary import vary_on_cookie
 from .models import Post, Group, Follow, User
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import render, redirect
+from django.shortcuts import get_object_or_404 as get_fresh_or_404
 from .forms import PostForm, CommentForm
-from .utils import get_paginator
-
-
+from .counters import counters_for
+from .object_cache import get_cached, get_object_or_404
+from .generations import (author_generation, card_generation,
+                          comments_etag, follow_etag, group_etag,
+                          group_generation, index_etag, index_generation,
+                          post_etag, profile_etag)
+from .utils import get_comments_page, get_lazy_page
+from .timeline import get_follow_page
+
+
+@vary_on_cookie
+@etag(index_etag)
 def index(request):
     template = 'posts/index.html'
     title = "Последние обновления на сайте"
-    post_list = Post.objects.all()
+    post_list = Post.objects.for_listing()
     context = {'title': title,
                'post_list': post_list,
-               'page_obj': get_paginator(request, post_list)
+               'page_obj': get_lazy_page(request, post_list),
+               'generation': index_generation(),
+               'card_generation': card_generation()
                }
     return render(request, template, context)
 
 
+@vary_on_cookie
+@etag(group_etag)
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     title = f"Записи сообщества {slug}"
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
+    post_list = group.posts.for_listing()
     context = {'title': title,
                'group': group,
                'post_list': post_list,
-               'page_obj': get_paginator(request, post_list)}
+               'page_obj': get_lazy_page(request, post_list),
+               'generation': group_generation(group),
+               'card_generation': card_generation()}
     return render(request, template, context)
 
 
+@vary_on_cookie
+@etag(profile_etag)
 def profile(request, username):
     template = 'posts/profile.html'
     author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    post_count = post_list.count()
+    post_list = author.posts.for_listing()
+    counters = counters_for(author)
     following = (request.user != author
                  and request.user.is_authenticated
                  and Follow.objects.filter(user=request.user,
                                            author=author))
     context = {'author': author,
-               'page_obj': get_paginator(request, post_list),
-               'post_count': post_count,
-               'following': following}
+               'page_obj': get_lazy_page(request, post_list),
+               'post_count': counters.posts_count,
+               'counters': counters,
+               'following': following,
+               'generation': author_generation(author),
+               'card_generation': card_generation()}
     return render(request, template, context)
 
 
+@vary_on_cookie
+@etag(post_etag)
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(Post, pk=post_id)
+    post.author = get_cached(User, pk=post.author_id)
+    if post.group_id is not None:
+        post.group = get_cached(Group, pk=post.group_id)
     post_author = post.author
     form = CommentForm(request.POST or None)
-    post_comments = post.comments.all()
+    post_comments = get_comments_page(request, post)
     title = f'Пост {post.text[:30]}'
-    post_count = post.author.posts.count()
+    post_count = counters_for(post.author).posts_count
     context = {'post': post,
                'post_count': post_count,
                'title': title,
@@ -62,17 +91,31 @@ def post_detail(request, post_id):
     return render(request, template, context)
 
 
+@vary_on_cookie
+@etag(comments_etag)
+def post_comments(request, post_id):
+    template = 'posts/includes/comments.html'
+    post = get_object_or_404(Post, pk=post_id)
+    context = {'post': post,
+               'post_comments': get_comments_page(request, post)}
+    return render(request, template, context)
+
+
 @login_required
 def post_create(request):
     template = 'posts/create_post.html'
     form = PostForm(
         request.POST or None,
-        files=request.FILES or None,)
+        files=request.FILES or None,
+        upload_oversized=getattr(request, 'upload_oversized', False))
     if request.method == 'POST':
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
-            post.save()
+            # Задачи миниатюр и раскладки по лентам ставятся в той же
+            # транзакции, что и пост.
+            with transaction.atomic():
+                post.save()
             return redirect('posts:profile', username=post.author)
         else:
             return render(request, template, {'form': form})
@@ -83,17 +126,20 @@ def post_create(request):
 @login_required
 def post_edit(request, post_id):
     template = 'posts/create_post.html'
-    post = get_object_or_404(Post, pk=post_id)
-    if post.author != request.user:
+    # Изменения сохраняются поверх строки из базы, а не из кэша.
+    post = get_fresh_or_404(Post, pk=post_id)
+    if post.author_id != request.user.pk:
         return redirect('posts:post_detail', post_id=post.pk)
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
-        instance=post)
+        instance=post,
+        upload_oversized=getattr(request, 'upload_oversized', False))
     context = {'form': form,
                'is_edit': True}
     if form.is_valid():
-        form.save()
+        with transaction.atomic():
+            form.save()
         return redirect('posts:post_detail', post_id=post.pk)
     context = {'form': form,
                'is_edit': True}
@@ -103,7 +149,7 @@ def post_edit(request, post_id):
 @login_required
 def add_comment(request, post_id):
     form = CommentForm(request.POST or None)
-    post_comment = get_object_or_404(Post, pk=post_id)
+    post_comment = get_fresh_or_404(Post, pk=post_id)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
@@ -113,13 +159,13 @@ def add_comment(request, post_id):
 
 
 @login_required
+@vary_on_cookie
+@etag(follow_etag)
 def follow_index(request):
     template = 'posts/follow.html'
-    author_post = Post.objects.filter(
-        author__following__user=request.user)
-    page_obj = get_paginator(request, author_post)
-    context = {'author_post': author_post,
-               'page_obj': page_obj}
+    page_obj = get_follow_page(request, request.user)
+    context = {'page_obj': page_obj,
+               'card_generation': card_generation()}
     return render(request, template, context)
 
 
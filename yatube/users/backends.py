@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from posts.models import User
+from posts.object_cache import get_cached, remember
+
+SESSION_HASH_KEY = 'session-hash:{}'
+
+
+def forget_session_hash(user_id):
+    cache.delete(SESSION_HASH_KEY.format(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """Берёт пользователя сессии из кэша объектов, а не из базы.
+
+    Пароля в кэше объектов нет, поэтому хеш для проверки сессии
+    кэшируется отдельно. Оба кэша сбрасывает сигнал сохранения
+    пользователя, поэтому смена пароля и блокировка видны на следующем
+    же запросе.
+    """
+
+    def get_user(self, user_id):
+        key = SESSION_HASH_KEY.format(user_id)
+        session_hash = cache.get(key)
+        if session_hash is None:
+            # Без хеша пользователь читается из базы целиком, с паролем.
+            user = User.objects.select_related('counters').filter(
+                pk=user_id).first()
+            if user is None or not self.user_can_authenticate(user):
+                return None
+            cache.set(key, user.get_session_auth_hash(),
+                      settings.OBJECT_CACHE_TIMEOUT)
+            remember(user)
+            return user
+        user = get_cached(User, pk=user_id)
+        if user is None or not self.user_can_authenticate(user):
+            return None
+        user.get_session_auth_hash = lambda: session_hash
+        return user
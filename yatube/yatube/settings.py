@@ -1,4 +1,8 @@
+import atexit
 import os
+import shutil
+import sys
+import tempfile
 
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -14,7 +18,6 @@ ALLOWED_HOSTS = [
     'localhost',
     '127.0.0.1',
     '[::1]',
-    'testserver',
 ]
 
 
@@ -65,13 +68,28 @@ TEMPLATES = [
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 
+# Соединение живёт CONN_MAX_AGE секунд и переиспользуется запросами
+# того же потока; каждое новое получает SQLITE_PRAGMAS (core.db).
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# busy_timeout идёт первым: переключение журнала тоже ждёт занятую базу.
+# Отрицательный cache_size задаётся в КиБ. Статистику планировщика
+# обновляет optimize_db, его стоит запускать по расписанию.
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -108,7 +126,10 @@ LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:posts'
 
 
-EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+# Письма ставятся в очередь фоновых задач, а отправляет их
+# QUEUED_EMAIL_BACKEND в run_workers.
+EMAIL_BACKEND = 'core.mail.QueuedEmailBackend'
+QUEUED_EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
@@ -116,8 +137,100 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Сессии и пользователи запросов читаются из кэша; срок сессии
+# продлевается, когда с прошлого сохранения прошла половина
+# SESSION_COOKIE_AGE (по умолчанию две недели).
+SESSION_ENGINE = 'core.session_backend'
+SESSION_RENEW_AFTER = 7 * 24 * 60 * 60
+
+# ModelBackend остаётся для сессий, созданных до CachedModelBackend.
+AUTHENTICATION_BACKENDS = [
+    'users.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Каталог для файлов, которые делят процессы сайта, но не должен читать
+# никто, кроме его пользователя: например, файл кэша.
+STATE_DIR = os.environ.get('YATUBE_STATE_DIR',
+                           os.path.join(BASE_DIR, 'state'))
+
+# manage.py test и pytest получают свой каталог на запуск и не трогают
+# кэш работающего сайта.
+if sys.argv[1:2] == ['test'] or 'pytest' in sys.modules:
+    STATE_DIR = tempfile.mkdtemp(prefix='yatube-test-')
+    atexit.register(shutil.rmtree, STATE_DIR, True)
+
+# Общий для всех воркеров хоста кэш: LRU в памяти процесса поверх
+# файла SQLite. Статистика уровней: manage.py cache_stats.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backend.TwoTierCache',
+        'LOCATION': os.path.join(STATE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 60,
+            'SYNC_INTERVAL': 0.05,
+        },
     }
 }
+
+# Сколько секунд хранятся найденные по slug, username и id объекты
+# и сколько — отметки об отсутствии объекта.
+OBJECT_CACHE_TIMEOUT = 5 * 60
+OBJECT_CACHE_MISSING_TIMEOUT = 30
+
+# Как часто каждый процесс заново строит фильтр существующих username,
+# slug и id постов, которым отвечает 404 без запроса к базе.
+EXISTENCE_REBUILD_INTERVAL = 5 * 60
+
+# Размеры миниатюр картинок постов: имя -> (геометрия, параметры sorl).
+# Все они создаются в фоне сразу после сохранения поста.
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+# Ширины, в которых создаётся каждая миниатюра (не шире исходной),
+# и форматы помимо основного для <source> в <picture>.
+POST_THUMBNAIL_WIDTHS = (320, 640, 960)
+POST_THUMBNAIL_FORMATS = ('WEBP',)
+# Сколько процессов кодируют картинки; 0 — кодировать в потоке воркера.
+THUMBNAIL_PROCESSES = 2
+
+# Приём картинок постов: наибольший размер файла, число пикселей,
+# сторона, до которой уменьшаются большие картинки, сколько картинок
+# декодируется одновременно, каждая в своём процессе (0 — в потоке
+# запроса), и тайм-аут декодирования.
+POST_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 40 * 10 ** 6
+POST_IMAGE_MAX_SIDE = 2560
+IMAGE_INGEST_PROCESSES = 2
+IMAGE_INGEST_TIMEOUT = 10
+FILE_UPLOAD_HANDLERS = ['posts.uploads.LimitedUploadHandler']
+
+# Фоновые задачи (core.jobs) выполняет команда run_workers: потоков
+# в процессе и пределы одновременных задач типа сверх заданных в @job.
+# JOBS_EAGER = True выполняет задачи сразу после фиксации транзакции,
+# без воркеров, например при разработке.
+JOB_WORKER_THREADS = 4
+JOB_CONCURRENCY = {}
+JOBS_EAGER = False
+
+# Сколько секунд файл картинки без ссылок хранится, прежде чем его
+# удалит collect_media.
+MEDIA_GC_GRACE = 24 * 60 * 60
+
+# Хранилище sorl, которое умеет читать миниатюры страницы одним запросом.
+THUMBNAIL_KVSTORE = 'posts.thumbnails.KVStore'
+
+# Как собирается лента подписок:
+# 'timeline' — материализованная лента читателя (fan-out on write),
+# 'merge' — слияние закэшированных списков постов авторов при чтении.
+# После переключения на 'timeline' выполните backfill_timelines --rebuild.
+FOLLOW_FEED = 'timeline'
+
+# Сколько последних постов хранится в ленте подписок каждого пользователя.
+TIMELINE_MAX_LENGTH = 1000
+
+# Длина и время жизни закэшированного списка постов автора.
+AUTHOR_TIMELINE_LENGTH = 200
+AUTHOR_TIMELINE_TIMEOUT = 60 * 60